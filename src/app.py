@@ -1,12 +1,51 @@
 import os
 import sys
-import cv2
-import numpy as np
 import streamlit as st
 
-from file_utils import get_list_images, get_abs_path, delete_file, create_directory
-from video_utils_ffmpeg import FFMPEGImageToVideoWriter, FFMPEGSavedImageToVideoWriter
-from utils_opencv import VideoWriter, VideoReader, get_font_dict, get_font_preview_image, get_preview_image_with_text
+import pipelines
+from file_utils import get_abs_path
+from job_checkpoint import list_job_checkpoints
+from video_utils_ffmpeg import probe_video_info
+from encoder_settings import EncoderSettings
+from image_viewer_cache import ImageViewerCache
+from video_playback import VideoFileServer, get_proxy_video, get_playback_url_base, is_local_host
+from utils_opencv import FrameNormalizer, get_font_dict, get_font_preview_image, get_cached_preview_image_with_text
+
+PIPELINE_ERRORS = (OSError, ValueError, RuntimeError)
+
+def get_encoder_settings_from_sidebar(video_encoder, crf=23, allow_two_pass=True):
+    encoder_mode = st.sidebar.selectbox("Encoder mode", ["custom", "draft", "balanced", "archival"], index=0)
+    if encoder_mode != "custom":
+        return EncoderSettings.from_mode(encoder_mode, video_encoder=video_encoder)
+
+    preset = st.sidebar.selectbox("Encoder preset", ["default"] + EncoderSettings.list_presets, index=0)
+    tune = st.sidebar.selectbox("Encoder tune", ["none"] + EncoderSettings.dict_tunes.get(video_encoder, []), index=0)
+    profile = st.sidebar.selectbox("Encoder profile", ["default"] + list(EncoderSettings.dict_profiles.get(video_encoder, {}).keys()), index=0)
+    threads = st.sidebar.number_input("Encoder threads (0 - auto)", value=0, min_value=0, max_value=128)
+    rate_control = st.sidebar.radio("Rate control", ["CRF", "Bitrate"], index=0)
+    bitrate = None
+    two_pass = False
+    if rate_control == "Bitrate":
+        bitrate = st.sidebar.text_input("Target bitrate", "4M")
+        if allow_two_pass:
+            two_pass = st.sidebar.checkbox("Two pass encoding", value=False)
+    return EncoderSettings(video_encoder=video_encoder, crf=crf,
+        preset=None if preset == "default" else preset, tune=None if tune == "none" else tune,
+        profile=None if profile == "default" else profile, threads=threads or None,
+        bitrate=bitrate, two_pass=two_pass)
+
+def get_frame_fit_from_sidebar():
+    fit_mode = st.sidebar.selectbox("Fit images of other dimensions by", FrameNormalizer.list_fit_modes, index=1)
+    list_interpolations = list(FrameNormalizer.dict_interpolations.keys())
+    interpolation = st.sidebar.selectbox("Resize interpolation", list_interpolations, index=list_interpolations.index("area"))
+    return fit_mode, interpolation
+
+def get_video_reader_from_sidebar():
+    reader_backend = st.sidebar.selectbox("Video decoder", ["opencv", "ffmpeg"], index=0)
+    num_decode_threads = 0
+    if reader_backend == "ffmpeg":
+        num_decode_threads = st.sidebar.slider("Video decoder threads (0 - auto)", value=0, min_value=0, max_value=max(1, os.cpu_count() or 1))
+    return reader_backend, num_decode_threads
 
 def saved_images_to_video_ffmpeg():
     st.title("FFMPEG - video generator from saved images")
@@ -17,39 +56,27 @@ def saved_images_to_video_ffmpeg():
     dir_images = st.sidebar.text_input("Directory with images", "images")
     img_format = st.sidebar.selectbox("Image file format to be used", [".png", ".jpg"], index=0)
     video_encoder = st.sidebar.selectbox("Video encoder to use", ["libx264", "libx265"], index=0)
+    num_chunks = st.sidebar.slider("Chunks encoded in parallel", value=1, min_value=1, max_value=max(1, os.cpu_count() or 1))
+    start_index = st.sidebar.number_input("First image index", value=0, min_value=0)
+    end_index = st.sidebar.number_input("End image index (0 - all images)", value=0, min_value=0)
+    fill_gaps = st.sidebar.checkbox("Hold the previous image over missing frame numbers", value=False)
+    encoder_settings = get_encoder_settings_from_sidebar(video_encoder, crf=crf)
     start_button = st.sidebar.button("Start video encoding")
 
     file_video = get_abs_path(file_video)
     dir_images = get_abs_path(dir_images)
 
     if start_button:
-        num_images = 0
-        ffmpeg_video_writer = FFMPEGSavedImageToVideoWriter(fps=fps, crf=crf,
-            file_video=file_video, dir_images=dir_images, img_format=img_format,
-            video_encoder=video_encoder)
-        st.write(ffmpeg_video_writer.ffmpeg_params)
-
-        if os.path.isdir(dir_images):
-            list_images = get_list_images(dir_images, img_format)
-            num_images = len(list_images)
-        else:
-            st.error(f"Not found, images dir : {dir_images}")
-            return
-
-        if os.path.isfile(file_video):
-            delete_file(file_video)
-            st.write(f"Deleting existing video : {file_video}")
-
-        if num_images > fps:
-            st.write(f"Images dir : {dir_images}")
-            st.write(f"Starting video generation with {num_images} images")
-            try:
-                ffmpeg_video_writer.generate_video_from_saved_images()
-                st.success(f"Video successfully created, saved in {file_video}")
-            except:
-                st.error("Unknown ffmpeg error")
-        else:
-            st.error(f"Num images : {num_images}, not enough")
+        progress_bar = st.progress(0.0)
+        stats_placeholder = st.empty()
+        try:
+            pipelines.saved_images_to_video_ffmpeg(dir_images, file_video, fps=fps, crf=crf,
+                img_format=img_format, video_encoder=video_encoder, num_chunks=num_chunks,
+                encoder_settings=encoder_settings, start_index=start_index, end_index=end_index or None, fill_gaps=fill_gaps,
+                log_callback=st.write, progress_callback=progress_bar.progress, stats_callback=stats_placeholder.json)
+            st.success(f"Video successfully created, saved in {file_video}")
+        except PIPELINE_ERRORS as err:
+            st.error(f"{err}")
     return
 
 def streaming_images_to_video_ffmpeg():
@@ -75,6 +102,14 @@ def streaming_images_to_video_ffmpeg():
     epilogue_text_pos_x = st.sidebar.slider("Epilogue text position x", value=12, min_value=0, max_value=int(0.75*width))
     epilogue_text_pos_y = st.sidebar.slider("Epilogue text position y", value=height//2, min_value=0, max_value=int(0.75*height))
     epilogue_text = st.sidebar.text_input("Enter epilogue text", "Thank you, the end")
+    num_fade_sec = st.sidebar.selectbox("Prologue and epilogue fade in/out (in sec.)", [0, 0.5, 1], index=0)
+    num_decode_workers = st.sidebar.slider("Image decoder threads", value=4, min_value=1, max_value=16)
+    prefetch_depth = st.sidebar.slider("Image prefetch depth", value=16, min_value=1, max_value=128)
+    fit_mode, interpolation = get_frame_fit_from_sidebar()
+    scale_in_ffmpeg = st.sidebar.checkbox("Scale images in ffmpeg", value=False)
+    encoder_settings = get_encoder_settings_from_sidebar(video_encoder, allow_two_pass=False)
+    num_segment_images = st.sidebar.number_input("Images per checkpointed segment", value=1800, min_value=1)
+    resume = st.sidebar.checkbox("Resume unfinished encoding", value=True)
     start_button = st.sidebar.button("Start video encoding")
 
     file_video = get_abs_path(file_video)
@@ -84,9 +119,12 @@ def streaming_images_to_video_ffmpeg():
     font_preview_img = get_font_preview_image()
     st.image(font_preview_img, caption="Font preview image")
 
+    prologue_img = None
+    epilogue_img = None
+
     if num_prologue_sec > 0:
         prologue_caption = "Prologue preview image"
-        prologue_img = get_preview_image_with_text(dict_fonts[font_text], prologue_text, height, width,
+        prologue_img = get_cached_preview_image_with_text(dict_fonts[font_text], prologue_text, height, width,
             (prologue_text_pos_x, prologue_text_pos_y), color_background=color_background,
             color_text=color_text, font_scale=font_scale)
         st.header(prologue_caption)
@@ -94,75 +132,149 @@ def streaming_images_to_video_ffmpeg():
 
     if num_epilogue_sec > 0:
         epilogue_caption = "Epilogue preview image"
-        epilogue_img = get_preview_image_with_text(dict_fonts[font_text], epilogue_text, height, width,
+        epilogue_img = get_cached_preview_image_with_text(dict_fonts[font_text], epilogue_text, height, width,
             (epilogue_text_pos_x, epilogue_text_pos_y), color_background=color_background,
             color_text=color_text, font_scale=font_scale)
         st.header(epilogue_caption)
         st.image(epilogue_img, caption=epilogue_caption)
 
     if start_button:
-        num_images = 0
-        ffmpeg_video_writer = FFMPEGImageToVideoWriter(fps=fps, width=width,
-            height=height, file_video=file_video, video_encoder=video_encoder)
-        st.write(ffmpeg_video_writer.ffmpeg_params)
-
-        if os.path.isdir(dir_images):
-            list_images = get_list_images(dir_images, img_format)
-            num_images_dir = len(list_images)
-            num_images_prologue = num_prologue_sec * fps
-            num_images_epilogue = num_epilogue_sec * fps
-            num_images_blank = 2 * fps
-            num_images = num_images_prologue + num_images_dir + num_images_epilogue + num_images_blank
-
-            img = cv2.imread(os.path.join(dir_images, list_images[0]))
-            if (img.shape[0] != height) or (img.shape[1] != width):
-                st.error(f"Image dimensions {img.shape[1]}x{img.shape[0]} mismatch with video encoding dimensions {width}x{height}")
-                return
-        else:
-            st.error(f"Not found, images dir : {dir_images}")
-            return
-
-        if os.path.isfile(file_video):
-            delete_file(file_video)
-            st.write(f"Deleting existing video : {file_video}")
-
-        if num_images > fps:
-            st.write(f"Images dir : {dir_images}")
-            st.write(f"Starting video generation with {num_images} images")
-            ffmpeg_video_writer.open_ffmpeg_process()
-            progress_bar = st.progress(0.0)
-
-            if num_prologue_sec > 0:
-                blank_img = np.zeros((height, width, 3), dtype=np.uint8)
-                for p in range(num_images_prologue):
-                    ffmpeg_video_writer.write_image_to_video(prologue_img)
-                    progress_bar.progress((p+1)/num_images)
-                for p_b in range(fps):
-                    ffmpeg_video_writer.write_image_to_video(blank_img)
-                    progress_bar.progress((p+1+p_b+1)/num_images)
-
-            for i in range(num_images_dir):
-                img = cv2.imread(os.path.join(dir_images, list_images[i]))
-                ffmpeg_video_writer.write_image_to_video(img)
-                progress_bar.progress((p+1+p_b+1+i+1)/num_images)
-
-            if num_epilogue_sec > 0:
-                blank_img = np.zeros((height, width, 3), dtype=np.uint8)
-                for e_b in range(fps):
-                    ffmpeg_video_writer.write_image_to_video(blank_img)
-                    progress_bar.progress((p+1+p_b+1+i+1+e_b+1)/num_images)
-                for e in range(num_images_epilogue):
-                    ffmpeg_video_writer.write_image_to_video(epilogue_img)
-                    progress_bar.progress((p+1+p_b+1+i+1+e_b+1+e+1)/num_images)
-
-            ffmpeg_video_writer.close_ffmpeg_process()
+        progress_bar = st.progress(0.0)
+        stats_placeholder = st.empty()
+        try:
+            pipelines.streaming_images_to_video_ffmpeg(dir_images, file_video, fps=fps, width=width, height=height,
+                img_format=img_format, video_encoder=video_encoder,
+                prologue_img=prologue_img, num_prologue_sec=num_prologue_sec,
+                epilogue_img=epilogue_img, num_epilogue_sec=num_epilogue_sec, num_fade_sec=num_fade_sec,
+                num_decode_workers=num_decode_workers, prefetch_depth=prefetch_depth, encoder_settings=encoder_settings,
+                fit_mode=fit_mode, interpolation=interpolation, scale_in_ffmpeg=scale_in_ffmpeg,
+                num_segment_images=num_segment_images, resume=resume,
+                log_callback=st.write, progress_callback=progress_bar.progress,
+                stats_callback=stats_placeholder.json)
             st.success(f"Video successfully created, saved in {file_video}")
-        else:
-            st.error(f"Num images : {num_images}, not enough")
+        except PIPELINE_ERRORS as err:
+            st.error(f"{err}")
     return
 
 def add_prologue_epilogue_to_video_ffmpeg():
-    st.warning("Yet to be implemented")
+    st.title("FFMPEG - add prologue and epilogue to video")
+    st.write(f"Current working dir - {os.getcwd()}")
+    dict_fonts = get_font_dict()
+    file_video_in = st.sidebar.text_input("Video file to load", "sample.mp4")
+    file_video_out = st.sidebar.text_input("Video file to be created", "sample_with_titles.mp4")
+
+    file_video_in = get_abs_path(file_video_in)
+    file_video_out = get_abs_path(file_video_out)
+
+    if not os.path.isfile(file_video_in):
+        st.error(f"Not found, video file: {file_video_in}")
+        return
+
+    try:
+        video_info = probe_video_info(file_video_in)
+    except RuntimeError as err:
+        st.error(f"{err}")
+        return
+    width = video_info.width
+    height = video_info.height
+    st.write(video_info)
+
+    num_prologue_sec = st.sidebar.slider("Prologue for the video (in sec.)", value=3, min_value=0, max_value=4)
+    num_epilogue_sec = st.sidebar.slider("Epilogue for the video (in sec.)", value=3, min_value=0, max_value=4)
+    color_background = st.sidebar.radio("Prologue and epilogue background color", ["black", "white"], index=0)
+    color_text = st.sidebar.radio("Prologue and epilogue text color", ["white", "black"], index=0)
+    font_text = st.sidebar.selectbox("Select font", list(dict_fonts.keys()), index=0)
+    font_scale = st.sidebar.slider("Select font scale", value=2, min_value=1, max_value=5)
+    prologue_text_pos_x = st.sidebar.slider("Prologue text position x", value=min(250, int(0.75*width)), min_value=0, max_value=int(0.75*width))
+    prologue_text_pos_y = st.sidebar.slider("Prologue text position y", value=height//2, min_value=0, max_value=int(0.75*height))
+    prologue_text = st.sidebar.text_input("Enter prologue text", "Title")
+    epilogue_text_pos_x = st.sidebar.slider("Epilogue text position x", value=12, min_value=0, max_value=int(0.75*width))
+    epilogue_text_pos_y = st.sidebar.slider("Epilogue text position y", value=height//2, min_value=0, max_value=int(0.75*height))
+    epilogue_text = st.sidebar.text_input("Enter epilogue text", "Thank you, the end")
+    start_button = st.sidebar.button("Start adding prologue and epilogue")
+
+    prologue_img = None
+    epilogue_img = None
+
+    if num_prologue_sec > 0:
+        prologue_caption = "Prologue preview image"
+        prologue_img = get_cached_preview_image_with_text(dict_fonts[font_text], prologue_text, height, width,
+            (prologue_text_pos_x, prologue_text_pos_y), color_background=color_background,
+            color_text=color_text, font_scale=font_scale)
+        st.header(prologue_caption)
+        st.image(prologue_img, caption=prologue_caption)
+
+    if num_epilogue_sec > 0:
+        epilogue_caption = "Epilogue preview image"
+        epilogue_img = get_cached_preview_image_with_text(dict_fonts[font_text], epilogue_text, height, width,
+            (epilogue_text_pos_x, epilogue_text_pos_y), color_background=color_background,
+            color_text=color_text, font_scale=font_scale)
+        st.header(epilogue_caption)
+        st.image(epilogue_img, caption=epilogue_caption)
+
+    if start_button:
+        try:
+            pipelines.add_prologue_epilogue_to_video_ffmpeg(file_video_in, file_video_out,
+                prologue_img=prologue_img, num_prologue_sec=num_prologue_sec,
+                epilogue_img=epilogue_img, num_epilogue_sec=num_epilogue_sec, log_callback=st.write)
+            st.success(f"Video successfully created, saved in {file_video_out}")
+        except PIPELINE_ERRORS as err:
+            st.error(f"{err}")
+    return
+
+def transform_video_ffmpeg():
+    st.title("FFMPEG - transform video")
+    st.write(f"Current working dir - {os.getcwd()}")
+    dict_fonts = get_font_dict()
+    file_video_in = st.sidebar.text_input("Video file to load", "sample.mp4")
+    file_video_out = st.sidebar.text_input("Video file to be created", "sample_transformed.mp4")
+
+    file_video_in = get_abs_path(file_video_in)
+    file_video_out = get_abs_path(file_video_out)
+
+    if not os.path.isfile(file_video_in):
+        st.error(f"Not found, video file: {file_video_in}")
+        return
+
+    try:
+        video_info = probe_video_info(file_video_in)
+    except RuntimeError as err:
+        st.error(f"{err}")
+        return
+    st.write(video_info)
+
+    start_sec = st.sidebar.number_input("Start time (in sec.)", value=0.0, min_value=0.0)
+    end_sec = st.sidebar.number_input("End time (in sec., 0 - end of the video)", value=0.0, min_value=0.0)
+    width = st.sidebar.number_input("Video width", value=video_info.width)
+    height = st.sidebar.number_input("Video height", value=video_info.height)
+    fit_mode, interpolation = get_frame_fit_from_sidebar()
+    overlay_text = st.sidebar.text_input("Overlay text (empty - no overlay)", "")
+    font_text = st.sidebar.selectbox("Select font", list(dict_fonts.keys()), index=1)
+    font_scale = st.sidebar.slider("Select font scale", value=1, min_value=1, max_value=5)
+    color_text = st.sidebar.radio("Overlay text color", ["white", "black"], index=0)
+    overlay_pos_x = st.sidebar.slider("Overlay text position x", value=20, min_value=0, max_value=max(1, int(width)))
+    overlay_pos_y = st.sidebar.slider("Overlay text position y", value=40, min_value=0, max_value=max(1, int(height)))
+    keep_audio = st.sidebar.checkbox("Keep the audio", value=True)
+    reader_backend, num_decode_threads = get_video_reader_from_sidebar()
+    video_encoder = st.sidebar.selectbox("Video encoder to use", ["libx264", "libx265"], index=0)
+    encoder_settings = get_encoder_settings_from_sidebar(video_encoder, allow_two_pass=False)
+    start_button = st.sidebar.button("Start video transform")
+
+    if start_button:
+        progress_bar = st.progress(0.0)
+        stats_placeholder = st.empty()
+        try:
+            num_frames = pipelines.transform_video_ffmpeg(file_video_in, file_video_out, start_sec=start_sec,
+                end_sec=end_sec or None, width=width, height=height, fit_mode=fit_mode, interpolation=interpolation,
+                overlay_text=overlay_text, overlay_position=(overlay_pos_x, overlay_pos_y), font=dict_fonts[font_text],
+                font_scale=font_scale, color_text=color_text, keep_audio=keep_audio, encoder_settings=encoder_settings,
+                reader_backend=reader_backend, num_decode_threads=num_decode_threads,
+                log_callback=st.write, progress_callback=progress_bar.progress,
+                stats_callback=stats_placeholder.json)
+            st.success(f"Video of {num_frames} frames successfully created, saved in {file_video_out}")
+        except PIPELINE_ERRORS as err:
+            st.error(f"{err}")
+    return
 
 def images_to_video_opencv():
     st.title("OpenCV - video generator from images")
@@ -174,52 +286,23 @@ def images_to_video_opencv():
     dir_images = st.sidebar.text_input("Directory with images", "images")
     img_format = st.sidebar.selectbox("Image file format to be used", [".png", ".jpg"], index=0)
     video_encoder = st.sidebar.selectbox("Video encoder to use", ["mp4v", "xvid"], index=0)
+    fit_mode, interpolation = get_frame_fit_from_sidebar()
     start_button = st.sidebar.button("Start video encoding")
 
     file_video = get_abs_path(file_video)
     dir_images = get_abs_path(dir_images)
 
     if start_button:
-        num_images = 0
-        opencv_video_writer = VideoWriter(fps=fps, width=width, height=height,
-            file_video=file_video, video_encoder=video_encoder)
-        st.write(opencv_video_writer.params)
-
-        if not os.path.isdir(dir_images):
-            st.error(f"Not found, images dir : {dir_images}")
-            return
-
-        dir_out = os.path.dirname(file_video)
-        if not os.path.isdir(dir_out):
-            _ = create_directory(dir_out)
-            st.write(f"Created directory : {dir_out}")
-
-        if os.path.isfile(file_video):
-            delete_file(file_video)
-            st.write(f"Deleting existing video : {file_video}")
-
-        list_images = sorted([f for f in os.listdir(dir_images) if f.endswith(img_format)])
-        num_images = len(list_images)
-
-        if num_images > fps:
-            st.write(f"Images dir : {dir_images}")
-            st.write(f"Starting video generation with {num_images} images")
-
-            img = cv2.imread(os.path.join(dir_images, list_images[0]))
-            if (img.shape[0] != height or img.shape[1] != width):
-                st.error(f"Image dimensions {img.shape[1]}x{img.shape[0]} mismatch with video dimensions {width}x{height}")
-                return
-
-            opencv_video_writer.init_video_writer()
-            progress_bar = st.progress(0.0)
-            for i in range(num_images):
-                img = cv2.imread(os.path.join(dir_images, list_images[i]))
-                opencv_video_writer.write_image_to_video(img)
-                progress_bar.progress((i+1)/num_images)
-            opencv_video_writer.close_video_writer()
+        progress_bar = st.progress(0.0)
+        stats_placeholder = st.empty()
+        try:
+            pipelines.images_to_video_opencv(dir_images, file_video, fps=fps, width=width, height=height,
+                img_format=img_format, video_encoder=video_encoder, fit_mode=fit_mode, interpolation=interpolation,
+                log_callback=st.write, progress_callback=progress_bar.progress,
+                stats_callback=stats_placeholder.json)
             st.success(f"Video successfully created, saved in {file_video}")
-        else:
-            st.error(f"Num images : {num_images}, not enough")
+        except PIPELINE_ERRORS as err:
+            st.error(f"{err}")
     return
 
 def video_to_images_opencv():
@@ -230,77 +313,137 @@ def video_to_images_opencv():
     img_prefix = st.sidebar.text_input("Prefix to use for image files", "image-")
     img_format = st.sidebar.selectbox("Image file format for saving", [".png", ".jpg"], index=0)
     img_id_start = st.sidebar.selectbox("Image start id to use", [10000, 100000, 1000000], index=0)
+    num_write_workers = st.sidebar.slider("Image writer threads", value=4, min_value=1, max_value=16)
+    max_queue_size = st.sidebar.slider("Max images queued for writing", value=32, min_value=1, max_value=256)
+    png_compression = st.sidebar.slider("PNG compression level", value=3, min_value=0, max_value=9)
+    jpeg_quality = st.sidebar.slider("JPEG quality", value=95, min_value=0, max_value=100)
+    reader_backend, num_decode_threads = get_video_reader_from_sidebar()
+    start_sec = st.sidebar.number_input("Start time (in sec.)", value=0.0, min_value=0.0)
+    end_sec = st.sidebar.number_input("End time (in sec., 0 - end of the video)", value=0.0, min_value=0.0)
+    stride = st.sidebar.number_input("Extract every n-th frame", value=1, min_value=1)
+    keyframes_only = st.sidebar.checkbox("Extract keyframes only", value=False)
+    scene_threshold = None
+    if st.sidebar.checkbox("Extract scene changes only", value=False):
+        scene_threshold = st.sidebar.slider("Scene change threshold", value=0.1, min_value=0.01, max_value=0.5, step=0.01)
+    resume = st.sidebar.checkbox("Resume unfinished extraction", value=True)
     start_button = st.sidebar.button("Start image extraction")
 
     file_video = get_abs_path(file_video)
     dir_images = get_abs_path(dir_images)
 
     if start_button:
-        if not os.path.isfile(file_video):
-            st.error(f"Not found, video file: {file_video}")
-            return
-
-        opencv_video_reader = VideoReader(file_video)
-
-        try:
-            opencv_video_reader.init_video_reader()
-        except:
-            st.error(f"Failed to load the video: {file_video}")
-            return
-
-        if not os.path.isdir(dir_images):
-            _ = create_directory(dir_images)
-            st.write(f"Created directory : {dir_images}")
-
-        num_images = opencv_video_reader.get_num_images_in_video()
-        st.write(f"Video file : {file_video}")
-        st.write(f"Extracting {num_images} images from {file_video}")
         progress_bar = st.progress(0.0)
-        for i in range(num_images):
-            success, image_frame = opencv_video_reader.get_nth_image(i)
-            if not success:
-                break
-            file_name = os.path.join(dir_images, img_prefix + str(img_id_start+i) + img_format)
-            cv2.imwrite(file_name, image_frame)
-            progress_bar.progress((i+1)/num_images)
-        st.success(f"Extraction of {num_images} images completed, images are saved in : {dir_images}")
+        stats_placeholder = st.empty()
+        try:
+            num_written = pipelines.video_to_images_opencv(file_video, dir_images, img_prefix=img_prefix,
+                img_format=img_format, img_id_start=img_id_start, num_write_workers=num_write_workers,
+                max_queue_size=max_queue_size, png_compression=png_compression, jpeg_quality=jpeg_quality,
+                reader_backend=reader_backend, num_decode_threads=num_decode_threads,
+                start_sec=start_sec, end_sec=end_sec or None, stride=stride, keyframes_only=keyframes_only,
+                scene_threshold=scene_threshold, resume=resume, log_callback=st.write, progress_callback=progress_bar.progress,
+                stats_callback=stats_placeholder.json)
+            st.success(f"Extraction of {num_written} images completed, images are saved in : {dir_images}")
+        except PIPELINE_ERRORS as err:
+            st.error(f"{err}")
     return
 
+@st.cache_resource
+def get_image_viewer_cache(dir_images, img_format):
+    return ImageViewerCache(dir_images, img_format)
+
 def image_viewer():
     st.title("Image viewer")
     st.write(f"Current working dir - {os.getcwd()}")
     dir_images = st.sidebar.text_input("Directory with images", "images")
     img_format = st.sidebar.selectbox("Image file format for saving", [".png", ".jpg"], index=0)
+    display_width = st.sidebar.selectbox("Preview width", [640, 1280, 1920, "Full resolution"], index=1)
     dir_images = get_abs_path(dir_images)
+    if not os.path.isdir(dir_images):
+        st.error(f"Not found, images dir : {dir_images}")
+        return
     try:
         st.header(f"Image dir - {dir_images}")
-        list_images = sorted([f for f in os.listdir(dir_images) if f.endswith(img_format)])
-        num_images = len(list_images)
+        image_viewer_cache = get_image_viewer_cache(dir_images, img_format)
+        num_images = len(image_viewer_cache.get_list_images())
+        list_gaps = image_viewer_cache.image_sequence_index.get_gaps()
+        if len(list_gaps) > 0:
+            st.warning(f"Missing frame numbers : {list_gaps[:10]}" + (" ..." if len(list_gaps) > 10 else ""))
         image_id = st.sidebar.slider(
             f"Select image_id ({0}-{num_images-1})", min_value=0, max_value=num_images-1,
             value=0, step=1,
         )
-        img = cv2.imread(os.path.join(dir_images, list_images[image_id]))
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        st.image(img, caption=list_images[image_id])
+        file_image, img = image_viewer_cache.get_image(image_id,
+            display_width=None if display_width == "Full resolution" else display_width)
+        st.image(img, caption=file_image)
     except:
-        st.error(f"Not found, images dir : {dir_images}")
+        st.error(f"Failed to load images from dir : {dir_images}")
         return
 
+@st.cache_resource
+def get_video_file_server(host, port, url_base):
+    video_file_server = VideoFileServer(host=host, port=port, url_base=url_base or None)
+    video_file_server.start()
+    return video_file_server
+
+def get_browser_host():
+    """
+    Returns the host the browser used to reach the app, so the playback urls are reachable by remote users
+    """
+    browser_host = None
+    if hasattr(st, "context"):
+        browser_host = st.context.headers.get("Host")
+    return browser_host or st.get_option("browser.serverAddress") or "localhost"
+
 def video_player():
     st.title("Video player")
     st.write(f"Current working dir - {os.getcwd()}")
     file_video = st.sidebar.text_input("Video file", "sample.mp4")
+    use_proxy = st.sidebar.checkbox("Play low bitrate proxy (transcoded once and cached)", value=False)
+    proxy_height = st.sidebar.selectbox("Proxy height", [360, 480, 720], index=1)
+    browser_host = get_browser_host()
+    server_host = st.sidebar.text_input("Playback server host", "127.0.0.1" if is_local_host(browser_host) else "0.0.0.0")
+    server_port = st.sidebar.number_input("Playback server port", value=8765, min_value=1024, max_value=65535)
+    server_url_base = st.sidebar.text_input("Playback server url seen by the browser",
+        get_playback_url_base(browser_host, int(server_port)))
     file_video = get_abs_path(file_video)
+    if not os.path.isfile(file_video):
+        st.error(f"Not found, video file : {file_video}")
+        return
     try:
+        if use_proxy:
+            with st.spinner(f"Creating proxy video of {file_video}"):
+                file_video = get_proxy_video(file_video, height=proxy_height)
         st.header(f"Playing video file - {file_video}")
-        video_file_des = open(file_video, "rb")
-        video_bytes = video_file_des.read()
-        st.video(video_bytes)
-    except:
-        st.error(f"Error in loading the video file - {file_video}")
+        video_file_server = get_video_file_server(server_host, int(server_port), server_url_base)
+        st.video(video_file_server.register_file(file_video))
+    except (OSError, RuntimeError) as err:
+        st.error(f"Error in loading the video file - {file_video}, {err}")
         return
 
+def resume_job():
+    st.title("Resume unfinished job")
+    list_checkpoints = list_job_checkpoints()
+    if len(list_checkpoints) == 0:
+        st.info("No unfinished jobs")
+        return
+    dict_checkpoints = {job_checkpoint.job_id : job_checkpoint for job_checkpoint in list_checkpoints}
+    job_id = st.sidebar.selectbox("Unfinished job", list(dict_checkpoints.keys()))
+    job_checkpoint = dict_checkpoints[job_id]
+    st.json({"job_type" : job_checkpoint.state["job_type"], "data" : job_checkpoint.state["data"],
+        "params" : {key : value for key, value in job_checkpoint.state["params"].items() if not isinstance(value, dict)}})
+    start_button = st.sidebar.button("Resume job")
+
+    if start_button:
+        progress_bar = st.progress(0.0)
+        stats_placeholder = st.empty()
+        try:
+            pipelines.resume_job(job_id, log_callback=st.write, progress_callback=progress_bar.progress,
+                stats_callback=stats_placeholder.json)
+            st.success(f"Job {job_id} completed")
+        except PIPELINE_ERRORS as err:
+            st.error(f"{err}")
+    return
+
 def app_info():
     st.title("Image and video editor app info")
     st.markdown("_About app - Useful for image and video editing_")
@@ -312,8 +455,10 @@ video_editor_modes = {
     "FFMPEG - streaming images to video" : streaming_images_to_video_ffmpeg,
     "FFMPEG - add prologue and epilogue to video" : add_prologue_epilogue_to_video_ffmpeg,
     "FFMPEG - saved images to video" : saved_images_to_video_ffmpeg,
+    "FFMPEG - transform video" : transform_video_ffmpeg,
     "OpenCV - images to video" : images_to_video_opencv,
     "OpenCV - video to images" : video_to_images_opencv,
+    "Resume unfinished job" : resume_job,
     "Image viewer" : image_viewer,
     "Video player" : video_player,
     "App info" : app_info,
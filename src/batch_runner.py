@@ -0,0 +1,183 @@
+"""
+Headless batch runner for the editor modes, runs the jobs of a json job spec file concurrently
+
+usage : python batch_runner.py jobs.json --max_workers 4 --max_ffmpeg_processes 2 --file_report report.json
+
+job spec file format
+{
+    "max_workers" : 4,
+    "jobs" : [
+        {"name" : "dir_001", "type" : "streaming_images_to_video_ffmpeg",
+            "params" : {"dir_images" : "dir_001", "file_video" : "dir_001.mp4", "fps" : 30, "width" : 640, "height" : 480,
+                "encoder_settings" : {"mode" : "draft", "video_encoder" : "libx264"}},
+            "prologue" : {"text" : "Title", "num_sec" : 3, "position" : [250, 240]}},
+        {"name" : "dir_002", "type" : "video_to_images_opencv",
+            "params" : {"file_video" : "dir_002.mp4", "dir_images" : "dir_002"}},
+        {"name" : "clip", "type" : "transform_video_ffmpeg",
+            "params" : {"file_video_in" : "dir_002.mp4", "file_video_out" : "clip.mp4", "start_sec" : 5, "end_sec" : 20, "width" : 1280, "height" : 720},
+            "overlay" : {"text" : "Camera 2", "position" : [20, 40], "font" : "SIMPLEX", "font_scale" : 1}},
+        {"name" : "title", "type" : "title_card_ffmpeg",
+            "params" : {"file_out" : "title.mp4", "fps" : 30, "num_sec" : 3},
+            "title" : {"text" : "Title", "width" : 640, "height" : 480, "position" : [250, 240]}}
+    ]
+}
+
+prologue, epilogue and title specs accept text, position, num_sec, width, height, font,
+font_scale, color_background and color_text, overlay specs accept text, position, font,
+font_scale and color_text, relative paths are resolved against the directory of the job spec file.
+Streaming encodes and image extractions are checkpointed, rerunning the job spec resumes the unfinished ones,
+"params" : {"resume" : false} starts a job over and a "resume_job" job with "params" : {"job_id" : ...}
+resumes the unfinished job of that id
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pipelines
+from pipeline_stats import PipelineStats
+from encoder_settings import EncoderSettings
+from ffmpeg_runner import set_max_ffmpeg_processes
+from video_utils_ffmpeg import probe_video_info
+from utils_opencv import get_font_dict, get_cached_preview_image_with_text
+
+dict_job_types = {
+    "saved_images_to_video_ffmpeg" : pipelines.saved_images_to_video_ffmpeg,
+    "streaming_images_to_video_ffmpeg" : pipelines.streaming_images_to_video_ffmpeg,
+    "add_prologue_epilogue_to_video_ffmpeg" : pipelines.add_prologue_epilogue_to_video_ffmpeg,
+    "transform_video_ffmpeg" : pipelines.transform_video_ffmpeg,
+    "images_to_video_opencv" : pipelines.images_to_video_opencv,
+    "video_to_images_opencv" : pipelines.video_to_images_opencv,
+    "title_card_ffmpeg" : pipelines.title_card_ffmpeg,
+    "resume_job" : pipelines.resume_job,
+}
+
+list_path_params = ["dir_images", "file_video", "file_video_in", "file_video_out", "file_out"]
+
+def get_title_card_image(title_spec, height, width):
+    dict_fonts = get_font_dict()
+    height = title_spec.get("height", height)
+    width = title_spec.get("width", width)
+    text_position = tuple(title_spec.get("position", [width//4, height//2]))
+    title_img = get_cached_preview_image_with_text(dict_fonts[title_spec.get("font", "PLAIN")],
+        title_spec.get("text", ""), height, width, text_position,
+        color_background=title_spec.get("color_background", "black"),
+        color_text=title_spec.get("color_text", "white"),
+        font_scale=title_spec.get("font_scale", 2))
+    return title_img
+
+def get_job_params(job, dir_base):
+    """
+    Returns the keyword arguments of the pipeline function for the job
+    """
+    params = dict(job.get("params", {}))
+    for key in list_path_params:
+        if key in params:
+            params[key] = os.path.abspath(os.path.join(dir_base, params[key]))
+
+    if "encoder_settings" in params:
+        params["encoder_settings"] = EncoderSettings.from_dict(params["encoder_settings"])
+
+    height = params.get("height", 480)
+    width = params.get("width", 640)
+    if job["type"] == "add_prologue_epilogue_to_video_ffmpeg":
+        video_info = probe_video_info(params["file_video_in"])
+        height, width = video_info.height, video_info.width
+
+    for title_key in ["prologue", "epilogue"]:
+        if title_key in job:
+            params[f"{title_key}_img"] = get_title_card_image(job[title_key], height, width)
+            params[f"num_{title_key}_sec"] = job[title_key].get("num_sec", 3)
+    if "title" in job:
+        params["title_img"] = get_title_card_image(job["title"], height, width)
+    if "overlay" in job:
+        overlay_spec = job["overlay"]
+        params["overlay_text"] = overlay_spec.get("text", "")
+        params["overlay_position"] = tuple(overlay_spec.get("position", [20, 40]))
+        params["font"] = get_font_dict()[overlay_spec.get("font", "SIMPLEX")]
+        params["font_scale"] = overlay_spec.get("font_scale", 1)
+        params["color_text"] = overlay_spec.get("color_text", "white")
+    return params
+
+def run_job(job, dir_base):
+    """
+    Runs a single job in a worker process and returns a json serializable result
+    """
+    time_start = time.time()
+    result = {"name" : job.get("name"), "type" : job["type"], "success" : False}
+    log_messages = []
+    try:
+        params = get_job_params(job, dir_base)
+        job_function = dict_job_types[job["type"]]
+        pipeline_stats = None
+        if "pipeline_stats" in inspect.signature(job_function).parameters:
+            pipeline_stats = PipelineStats()
+            params["pipeline_stats"] = pipeline_stats
+        output = job_function(**params, log_callback=lambda msg: log_messages.append(str(msg)))
+        result["success"] = True
+        result["output"] = output
+        if pipeline_stats is not None:
+            result["stats"] = pipeline_stats.get_summary()
+    except Exception as err:
+        result["error"] = f"{type(err).__name__} : {err}"
+        result["traceback"] = traceback.format_exc()
+    result["log"] = log_messages
+    result["time_elapsed"] = time.time() - time_start
+    return result
+
+def load_job_spec(file_job_spec):
+    with open(file_job_spec, "r") as file_des:
+        job_spec = json.load(file_des)
+    if isinstance(job_spec, list):
+        job_spec = {"jobs" : job_spec}
+
+    for i, job in enumerate(job_spec["jobs"]):
+        if job.get("type") not in dict_job_types:
+            raise ValueError(f"Job {i} has unknown type : {job.get('type')}, valid types : {list(dict_job_types.keys())}")
+        job.setdefault("name", f"job_{i}")
+    return job_spec
+
+def run_jobs(list_jobs, dir_base, max_workers=1, max_ffmpeg_processes=None):
+    """
+    Runs the jobs in max_workers processes, max_ffmpeg_processes caps the concurrent ffmpeg processes of each worker
+    """
+    list_results = []
+    initializer, initargs = (set_max_ffmpeg_processes, (max_ffmpeg_processes,)) if max_ffmpeg_processes else (None, ())
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs) as executor:
+        dict_futures = {executor.submit(run_job, job, dir_base) : job for job in list_jobs}
+        for future in as_completed(dict_futures):
+            result = future.result()
+            status = "done" if result["success"] else f"failed, {result['error']}"
+            print(f"[{len(list_results)+1}/{len(list_jobs)}] {result['name']} ({result['type']}) {status} in {result['time_elapsed']:.1f} sec.")
+            list_results.append(result)
+    return list_results
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("file_job_spec", type=str, help="json file with the job specs")
+    parser.add_argument("--max_workers", type=int, default=None, help="max number of jobs run concurrently, overrides the job spec file")
+    parser.add_argument("--max_ffmpeg_processes", type=int, default=None, help="max number of ffmpeg processes run concurrently by each job worker")
+    parser.add_argument("--file_report", type=str, default=None, help="json file to save the job results")
+    args = parser.parse_args()
+
+    file_job_spec = os.path.abspath(args.file_job_spec)
+    job_spec = load_job_spec(file_job_spec)
+    max_workers = args.max_workers or job_spec.get("max_workers", os.cpu_count())
+    list_results = run_jobs(job_spec["jobs"], os.path.dirname(file_job_spec), max_workers=max_workers,
+        max_ffmpeg_processes=args.max_ffmpeg_processes or job_spec.get("max_ffmpeg_processes"))
+
+    if args.file_report is not None:
+        with open(args.file_report, "w") as file_des:
+            json.dump(list_results, file_des, indent=4)
+
+    num_failed = sum(not result["success"] for result in list_results)
+    print(f"Completed {len(list_results)} jobs, {num_failed} failed")
+    return 1 if num_failed > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
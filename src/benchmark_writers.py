@@ -0,0 +1,177 @@
+"""
+Encode throughput benchmark of the video writer backends on synthetic image directories
+
+usage : python benchmark_writers.py --resolutions 640x480 1920x1080 --list_num_frames 150 600 --file_report bench.json
+
+every run is executed in a fresh process so that peak RSS (of the python process and
+of its ffmpeg child processes) is measured per backend, results are reported as json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+import cv2
+import numpy as np
+
+from file_utils import get_list_images, create_directory
+from video_utils_ffmpeg import FFMPEGImageToVideoWriter, FFMPEGSavedImageToVideoWriter, FFMPEGChunkedImageToVideoWriter
+from utils_opencv import VideoWriter, ImagePrefetcher
+
+def generate_synthetic_images(dir_images, width, height, num_frames, img_format=".png", seed=4):
+    """
+    Writes num_frames images of a smooth random texture translated by a few pixels per frame,
+    so that the encoders see motion similar to camera footage
+    """
+    _ = create_directory(dir_images)
+    rng = np.random.default_rng(seed)
+    texture = rng.integers(0, 256, size=(height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    texture = cv2.resize(texture, (2 * width, 2 * height), interpolation=cv2.INTER_CUBIC)
+    for i in range(num_frames):
+        offset_x = (3 * i) % width
+        offset_y = (2 * i) % height
+        img = texture[offset_y:offset_y+height, offset_x:offset_x+width]
+        cv2.imwrite(os.path.join(dir_images, f"image-{10000+i}{img_format}"), img)
+    return
+
+def run_ffmpeg_saved(dir_images, file_video, width, height, fps, img_format):
+    FFMPEGSavedImageToVideoWriter(dir_images, file_video, fps=fps, img_format=img_format).generate_video_from_saved_images()
+    return
+
+def run_ffmpeg_chunked(dir_images, file_video, width, height, fps, img_format):
+    list_images = get_list_images(dir_images, img_format)
+    FFMPEGChunkedImageToVideoWriter(dir_images, list_images, file_video, fps=fps,
+        num_chunks=max(1, (os.cpu_count() or 1) // 4)).generate_video_from_saved_images()
+    return
+
+def run_ffmpeg_pipe(dir_images, file_video, width, height, fps, img_format):
+    list_images = get_list_images(dir_images, img_format)
+    ffmpeg_video_writer = FFMPEGImageToVideoWriter(file_video, fps=fps, width=width, height=height)
+    ffmpeg_video_writer.open_ffmpeg_process()
+    for _, img in ImagePrefetcher(dir_images, list_images):
+        ffmpeg_video_writer.write_image_to_video(img)
+    ffmpeg_video_writer.close_ffmpeg_process()
+    return
+
+def run_opencv(dir_images, file_video, width, height, fps, img_format):
+    list_images = get_list_images(dir_images, img_format)
+    opencv_video_writer = VideoWriter(fps, width, height, file_video, "mp4v")
+    opencv_video_writer.init_video_writer()
+    for file_image in list_images:
+        opencv_video_writer.write_image_to_video(cv2.imread(os.path.join(dir_images, file_image)))
+    opencv_video_writer.close_video_writer()
+    return
+
+dict_backends = {
+    "ffmpeg_saved" : run_ffmpeg_saved,
+    "ffmpeg_chunked" : run_ffmpeg_chunked,
+    "ffmpeg_pipe" : run_ffmpeg_pipe,
+    "opencv" : run_opencv,
+}
+
+def run_backend_in_process(backend, dir_images, file_video, width, height, fps, img_format, result_queue):
+    time_start = time.perf_counter()
+    try:
+        dict_backends[backend](dir_images, file_video, width, height, fps, img_format)
+        error = None
+    except Exception as err:
+        error = f"{type(err).__name__} : {err}"
+    time_wall = time.perf_counter() - time_start
+    # ru_maxrss is in KiB on linux and in bytes on macos
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+    result_queue.put({
+        "time_wall" : time_wall,
+        "peak_rss_self" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_scale,
+        "peak_rss_children" : resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_scale,
+        "error" : error,
+    })
+    return
+
+def benchmark_backend(backend, dir_images, dir_out, width, height, num_frames, fps, img_format, repeat_id):
+    file_video = os.path.join(dir_out, f"{backend}_{width}x{height}_{num_frames}_{repeat_id}.mp4")
+    if os.path.isfile(file_video):
+        os.unlink(file_video)
+
+    mp_context = multiprocessing.get_context("spawn")
+    result_queue = mp_context.Queue()
+    process = mp_context.Process(target=run_backend_in_process,
+        args=(backend, dir_images, file_video, width, height, fps, img_format, result_queue))
+    process.start()
+    result = result_queue.get()
+    process.join()
+
+    result.update({
+        "backend" : backend,
+        "width" : width,
+        "height" : height,
+        "num_frames" : num_frames,
+        "repeat_id" : repeat_id,
+        "fps_encode" : num_frames / result["time_wall"] if result["time_wall"] > 0 else None,
+        "output_size" : os.path.getsize(file_video) if os.path.isfile(file_video) else None,
+    })
+    if result["output_size"] is None and result["error"] is None:
+        result["error"] = "output video not created"
+    return result
+
+def parse_resolution(resolution):
+    width, height = resolution.lower().split("x")
+    return int(width), int(height)
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--resolutions", nargs="+", default=["640x480", "1280x720", "1920x1080"], help="list of WxH resolutions")
+    parser.add_argument("--list_num_frames", nargs="+", type=int, default=[150, 600], help="list of number of frames")
+    parser.add_argument("--backends", nargs="+", default=list(dict_backends.keys()), choices=list(dict_backends.keys()), help="backends to benchmark")
+    parser.add_argument("--fps", type=int, default=30, help="fps of the videos")
+    parser.add_argument("--img_format", type=str, default=".png", help="image file format of the synthetic images")
+    parser.add_argument("--num_repeats", type=int, default=1, help="number of runs of every configuration")
+    parser.add_argument("--dir_work", type=str, default=None, help="directory for synthetic images and videos, a temp dir by default")
+    parser.add_argument("--keep_files", action="store_true", help="keep the synthetic images and videos")
+    parser.add_argument("--file_report", type=str, default=None, help="json file to save the results, printed to stdout otherwise")
+    args = parser.parse_args()
+
+    dir_work = args.dir_work or tempfile.mkdtemp(prefix="benchmark_writers_")
+    _ = create_directory(dir_work)
+    report = {
+        "platform" : platform.platform(),
+        "python" : platform.python_version(),
+        "opencv" : cv2.__version__,
+        "cpu_count" : os.cpu_count(),
+        "fps" : args.fps,
+        "img_format" : args.img_format,
+        "results" : [],
+    }
+
+    try:
+        for resolution in args.resolutions:
+            width, height = parse_resolution(resolution)
+            for num_frames in args.list_num_frames:
+                dir_images = os.path.join(dir_work, f"images_{width}x{height}_{num_frames}")
+                if len(get_list_images(dir_images, args.img_format) if os.path.isdir(dir_images) else []) != num_frames:
+                    generate_synthetic_images(dir_images, width, height, num_frames, img_format=args.img_format)
+                for backend in args.backends:
+                    for repeat_id in range(args.num_repeats):
+                        result = benchmark_backend(backend, dir_images, dir_work, width, height,
+                            num_frames, args.fps, args.img_format, repeat_id)
+                        fps_encode = "n/a" if result["fps_encode"] is None else f"{result['fps_encode']:.1f}"
+                        print(f"{backend} {width}x{height} {num_frames} frames : {result['time_wall']:.2f} sec., {fps_encode} fps", file=sys.stderr)
+                        report["results"].append(result)
+    finally:
+        if args.dir_work is None and not args.keep_files:
+            shutil.rmtree(dir_work, ignore_errors=True)
+
+    if args.file_report is not None:
+        with open(args.file_report, "w") as file_des:
+            json.dump(report, file_des, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import sys
+from dataclasses import dataclass, field, asdict
+from typing import ClassVar
+
+@dataclass
+class EncoderSettings:
+    """
+    Encoder options shared by the ffmpeg writers
+
+    Parameters
+    ----------
+    video_encoder (str) : video encoder to be used
+    preset (str) : encoder speed / compression trade off, None for the encoder default
+    tune (str) : encoder tuning, None for no tuning
+    crf (int) : constant rate factor, used when bitrate is None
+    bitrate (str) : target bitrate e.g. "4M", overrides crf
+    threads (int) : encoder threads, None or 0 lets the encoder decide
+    profile (str) : codec profile, None for the encoder default
+    pixel_format (str) : pixel format of the video
+    two_pass (bool) : two pass encoding at the target bitrate, needs a seekable input
+    x265_params (dict) : additional libx265 params
+    """
+    video_encoder : str = "libx264"
+    preset : str = None
+    tune : str = None
+    crf : int = 23
+    bitrate : str = None
+    threads : int = None
+    profile : str = None
+    pixel_format : str = "yuv420p"
+    two_pass : bool = False
+    x265_params : dict = field(default_factory=dict)
+
+    list_presets : ClassVar[list] = ["ultrafast", "superfast", "veryfast", "faster", "fast",
+        "medium", "slow", "slower", "veryslow", "placebo"]
+    dict_tunes : ClassVar[dict] = {
+        "libx264" : ["film", "animation", "grain", "stillimage", "fastdecode", "zerolatency", "psnr", "ssim"],
+        "libx265" : ["grain", "animation", "fastdecode", "zerolatency", "psnr", "ssim"],
+    }
+    dict_profiles : ClassVar[dict] = {
+        "libx264" : {"baseline" : ["yuv420p"], "main" : ["yuv420p"], "high" : ["yuv420p"],
+            "high10" : ["yuv420p", "yuv420p10le"], "high422" : ["yuv420p", "yuv422p", "yuv420p10le", "yuv422p10le"],
+            "high444" : ["yuv420p", "yuv422p", "yuv444p", "yuv420p10le", "yuv422p10le", "yuv444p10le"]},
+        "libx265" : {"main" : ["yuv420p"], "main10" : ["yuv420p", "yuv420p10le"],
+            "mainstillpicture" : ["yuv420p"], "main422-10" : ["yuv422p", "yuv422p10le"],
+            "main444-8" : ["yuv444p"], "main444-10" : ["yuv444p", "yuv444p10le"]},
+    }
+    dict_modes : ClassVar[dict] = {
+        "draft" : {"preset" : "ultrafast", "crf" : 28, "tune" : "fastdecode"},
+        "balanced" : {"preset" : "medium", "crf" : 23},
+        "archival" : {"preset" : "slower", "crf" : 18},
+    }
+
+    @classmethod
+    def from_mode(cls, mode, video_encoder="libx264", **kwargs):
+        """
+        Returns settings of a named mode, "draft" favours encoding speed and "archival" favours size and quality,
+        kwargs override the mode defaults
+        """
+        if mode not in cls.dict_modes:
+            raise ValueError(f"Unknown encoder mode : {mode}, valid modes : {list(cls.dict_modes.keys())}")
+        params = dict(cls.dict_modes[mode])
+        params.update(kwargs)
+        return cls(video_encoder=video_encoder, **params)
+
+    @classmethod
+    def from_dict(cls, dict_settings):
+        """
+        Returns settings from a dict, a "mode" key selects the mode defaults overridden by the other keys
+        """
+        dict_settings = dict(dict_settings)
+        mode = dict_settings.pop("mode", None)
+        if mode is not None:
+            return cls.from_mode(mode, **dict_settings)
+        return cls(**dict_settings)
+
+    def to_dict(self):
+        return asdict(self)
+
+    def has_preset_support(self):
+        return self.video_encoder in self.dict_tunes
+
+    def validate(self):
+        """
+        Raises ValueError for options not supported by the encoder or inconsistent with each other
+        """
+        if self.preset is not None:
+            if not self.has_preset_support():
+                raise ValueError(f"Presets are not supported by {self.video_encoder}")
+            if self.preset not in self.list_presets:
+                raise ValueError(f"Unknown preset : {self.preset}, valid presets : {self.list_presets}")
+        if self.tune is not None:
+            list_tunes = self.dict_tunes.get(self.video_encoder, [])
+            if self.tune not in list_tunes:
+                raise ValueError(f"Tune {self.tune} not supported by {self.video_encoder}, valid tunes : {list_tunes}")
+        if self.profile is not None:
+            dict_profiles = self.dict_profiles.get(self.video_encoder, {})
+            if self.profile not in dict_profiles:
+                raise ValueError(f"Profile {self.profile} not supported by {self.video_encoder}, valid profiles : {list(dict_profiles.keys())}")
+            if self.pixel_format not in dict_profiles[self.profile]:
+                raise ValueError(f"Pixel format {self.pixel_format} not supported by profile {self.profile}, valid pixel formats : {dict_profiles[self.profile]}")
+        if self.bitrate is None:
+            if self.crf is None:
+                raise ValueError("Either crf or bitrate has to be set")
+            if not (0 <= self.crf <= 51):
+                raise ValueError(f"CRF must be in the range 0-51, got {self.crf}")
+            if self.crf == 0 and self.video_encoder == "libx264" and self.profile not in (None, "high444"):
+                raise ValueError(f"Lossless encoding (CRF 0) is not supported by profile {self.profile}, use high444 or no profile")
+        if self.two_pass and self.bitrate is None:
+            raise ValueError("Two pass encoding needs a target bitrate")
+        if self.x265_params and self.video_encoder != "libx265":
+            raise ValueError(f"x265_params are not supported by {self.video_encoder}")
+        return
+
+    def get_ffmpeg_args(self, pass_num=None, file_passlog=None, extra_x265_params=None):
+        """
+        Returns the ffmpeg output options of the encoder
+
+        Parameters
+        ----------
+        pass_num (int) : 1 or 2 for two pass encoding, None for single pass
+        file_passlog (str) : prefix of the two pass log files
+        extra_x265_params (dict) : x265 params merged with the x265_params of the settings
+        """
+        self.validate()
+        ffmpeg_args = ["-c:v", self.video_encoder]
+        if self.preset is not None:
+            ffmpeg_args += ["-preset", self.preset]
+        if self.tune is not None:
+            ffmpeg_args += ["-tune", self.tune]
+        if self.profile is not None:
+            ffmpeg_args += ["-profile:v", self.profile]
+        if self.bitrate is not None:
+            ffmpeg_args += ["-b:v", f"{self.bitrate}"]
+        else:
+            ffmpeg_args += ["-crf", f"{self.crf}"]
+        if self.threads:
+            ffmpeg_args += ["-threads", f"{self.threads}"]
+
+        x265_params = dict(self.x265_params)
+        x265_params.update(extra_x265_params or {})
+        if pass_num is not None:
+            if self.video_encoder == "libx265":
+                x265_params.update({"pass" : pass_num, "stats" : f"{file_passlog}.log"})
+            else:
+                ffmpeg_args += ["-pass", f"{pass_num}", "-passlogfile", file_passlog]
+        if self.video_encoder == "libx265" and x265_params:
+            ffmpeg_args += ["-x265-params", ":".join(f"{key}={value}" for key, value in x265_params.items())]
+
+        ffmpeg_args += ["-pix_fmt", self.pixel_format]
+        return ffmpeg_args
@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from subprocess import Popen, PIPE, DEVNULL, TimeoutExpired
+
+class FFMPEGError(RuntimeError):
+    def __init__(self, message, run_result=None):
+        """
+        Parameters
+        ----------
+        message (str) : error message
+        run_result (FFMPEGRunResult) : result of the failed ffmpeg run
+        """
+        self.run_result = run_result
+        if run_result is not None and run_result.stderr_tail:
+            message = f"{message} : {run_result.stderr_tail[-2000:]}"
+        super().__init__(message)
+
+@dataclass
+class FFMPEGProgress:
+    frame : int = 0
+    fps : float = 0.0
+    speed : float = 0.0
+    out_time_sec : float = 0.0
+    total_size : int = 0
+    bitrate : str = None
+    is_end : bool = False
+
+    def update(self, key, value):
+        """
+        Updates the progress from a key=value line of the ffmpeg -progress output
+        """
+        try:
+            if key == "frame":
+                self.frame = int(value)
+            elif key == "fps":
+                self.fps = float(value)
+            elif key == "speed":
+                self.speed = float(value.rstrip("x")) if value.rstrip("x") not in ("", "N/A") else 0.0
+            elif key == "out_time_us":
+                self.out_time_sec = int(value) / 1e6
+            elif key == "total_size":
+                self.total_size = int(value)
+            elif key == "bitrate":
+                self.bitrate = value
+            elif key == "progress":
+                self.is_end = value == "end"
+                return True
+        except ValueError:
+            pass
+        return False
+
+@dataclass
+class FFMPEGRunResult:
+    cmd_ffmpeg : list
+    returncode : int = None
+    time_elapsed : float = 0.0
+    timed_out : bool = False
+    cancelled : bool = False
+    stderr_tail : str = ""
+    progress : FFMPEGProgress = field(default_factory=FFMPEGProgress)
+
+    @property
+    def success(self):
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+max_ffmpeg_processes = os.cpu_count() or 1
+ffmpeg_process_semaphore = threading.BoundedSemaphore(max_ffmpeg_processes)
+
+def set_max_ffmpeg_processes(num_processes):
+    """
+    Sets the cap on concurrently running ffmpeg processes of this python process,
+    must be called before any ffmpeg process is started
+    """
+    global max_ffmpeg_processes, ffmpeg_process_semaphore
+    max_ffmpeg_processes = max(1, num_processes)
+    ffmpeg_process_semaphore = threading.BoundedSemaphore(max_ffmpeg_processes)
+    return
+
+class FFMPEGProcessRunner:
+    def __init__(self, cmd_ffmpeg, progress_callback=None, timeout=None, use_stdin=False, use_stdout=False, num_stderr_lines=50,
+        use_process_cap=True):
+        """
+        Runs ffmpeg from an argv list, parses its -progress output and returns a structured result
+
+        Parameters
+        ----------
+        cmd_ffmpeg (list) : ffmpeg command as an argv list starting with "ffmpeg"
+        progress_callback (callable) : called with FFMPEGProgress after every progress block
+        timeout (float) : max run time in sec. from start, including the time spent feeding stdin, a watchdog
+            terminates the process after it and kills it if it does not exit within the grace period of cancel
+        use_stdin (bool) : opens a pipe to the stdin of ffmpeg, available as runner.stdin
+        use_stdout (bool) : the output of ffmpeg is read from its stdout, available as runner.stdout,
+            progress is not reported in this case
+        num_stderr_lines (int) : number of last stderr lines kept for error reporting
+        use_process_cap (bool) : the process counts against the cap of concurrent ffmpeg processes, long lived
+            pipe readers feeding a pipeline are exempt, a writer waiting for a slot held by its own reader would never start
+        """
+        self.cmd_ffmpeg = [cmd_ffmpeg[0], "-hide_banner", "-nostats",
+            *([] if use_stdout else ["-progress", "pipe:1"]),
+            *([] if use_stdin else ["-nostdin"]), *cmd_ffmpeg[1:]]
+        self.progress_callback = progress_callback
+        self.timeout = timeout
+        self.use_stdin = use_stdin
+        self.use_stdout = use_stdout
+        self.stderr_lines = deque(maxlen=num_stderr_lines)
+        self.result = FFMPEGRunResult(cmd_ffmpeg=self.cmd_ffmpeg)
+        self.process = None
+        self.threads = []
+        self.time_start = None
+        self.semaphore = None
+        self.use_process_cap = use_process_cap
+        self.watchdog = None
+
+    @property
+    def stdin(self):
+        return self.process.stdin
+
+    @property
+    def stdout(self):
+        return self.process.stdout
+
+    def read_progress(self):
+        for line in iter(self.process.stdout.readline, b""):
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            if self.result.progress.update(key, value) and self.progress_callback is not None:
+                self.progress_callback(self.result.progress)
+        return
+
+    def read_stderr(self):
+        for line in iter(self.process.stderr.readline, b""):
+            self.stderr_lines.append(line.decode(errors="replace").rstrip())
+        return
+
+    def start(self):
+        """
+        Starts ffmpeg, blocks while the cap of concurrent ffmpeg processes is reached unless use_process_cap is False
+        """
+        if self.use_process_cap:
+            self.semaphore = ffmpeg_process_semaphore
+            self.semaphore.acquire()
+        try:
+            self.time_start = time.perf_counter()
+            self.process = Popen(self.cmd_ffmpeg, stdin=PIPE if self.use_stdin else DEVNULL, stdout=PIPE, stderr=PIPE)
+        except OSError:
+            if self.semaphore is not None:
+                self.semaphore.release()
+                self.semaphore = None
+            raise
+        self.threads = [threading.Thread(target=self.read_stderr, daemon=True)]
+        if not self.use_stdout:
+            self.threads.append(threading.Thread(target=self.read_progress, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        if self.timeout is not None:
+            self.watchdog = threading.Timer(self.timeout, self.on_timeout)
+            self.watchdog.daemon = True
+            self.watchdog.start()
+        return self
+
+    def on_timeout(self):
+        """
+        Called by the watchdog, the blocked writes to stdin fail with BrokenPipeError once ffmpeg is terminated
+        """
+        if self.process.poll() is None:
+            self.result.timed_out = True
+            self.cancel()
+        return
+
+    def cancel(self, grace_period=5.0):
+        """
+        Terminates ffmpeg, it is killed if it does not exit within grace_period sec.
+        """
+        self.result.cancelled = True
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=grace_period)
+            except TimeoutExpired:
+                self.process.kill()
+        return
+
+    def wait(self, check=True):
+        """
+        Waits for ffmpeg to exit and returns FFMPEGRunResult, raises FFMPEGError on failure if check is True
+        """
+        if self.use_stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        try:
+            self.process.wait()
+        finally:
+            if self.watchdog is not None:
+                self.watchdog.cancel()
+                self.watchdog.join()
+                self.watchdog = None
+            for thread in self.threads:
+                thread.join()
+            if self.semaphore is not None:
+                self.semaphore.release()
+                self.semaphore = None
+
+        if self.use_stdout:
+            self.process.stdout.close()
+        self.result.returncode = self.process.returncode
+        self.result.time_elapsed = time.perf_counter() - self.time_start
+        self.result.stderr_tail = "\n".join(self.stderr_lines)
+        if check and not self.result.success:
+            reason = "timed out" if self.result.timed_out else "was cancelled" if self.result.cancelled else f"exited with code {self.result.returncode}"
+            raise FFMPEGError(f"ffmpeg {reason}", self.result)
+        return self.result
+
+    def run(self, check=True):
+        self.start()
+        return self.wait(check=check)
+
+def run_ffmpeg(cmd_ffmpeg, progress_callback=None, timeout=None, check=True):
+    """
+    Runs the ffmpeg argv list to completion and returns FFMPEGRunResult
+    """
+    return FFMPEGProcessRunner(cmd_ffmpeg, progress_callback=progress_callback, timeout=timeout).run(check=check)
@@ -1,9 +1,12 @@
 import os
 import sys
+from contextlib import contextmanager
+
+from image_sequence_index import get_image_sequence_index
 
 def get_list_images(dir_images, img_format):
-    list_images = os.listdir(dir_images)
-    list_images = sorted([f for f in list_images if f.endswith(img_format)])
+    image_sequence_index = get_image_sequence_index(dir_images, img_format)
+    list_images = list(image_sequence_index.list_images)
     return list_images
 
 def create_directory(dir_path):
@@ -20,3 +23,23 @@ def get_abs_path(file_path):
 def delete_file(file_path):
     os.unlink(file_path)
     return
+
+def get_partial_file(file_path):
+    root, ext = os.path.splitext(file_path)
+    return f"{root}.partial{ext}"
+
+@contextmanager
+def atomic_output_file(file_path):
+    """
+    Yields the path of a partial file next to file_path that is moved over file_path when the block
+    completes, so an existing file is kept until the new one is complete and a failure leaves no truncated file
+    """
+    file_partial = get_partial_file(file_path)
+    try:
+        yield file_partial
+    except BaseException:
+        if os.path.isfile(file_partial):
+            os.unlink(file_partial)
+        raise
+    os.replace(file_partial, file_path)
+    return
@@ -0,0 +1,103 @@
+import os
+import sys
+import re
+import threading
+
+number_pattern = re.compile(r"(\d+)")
+frame_number_pattern = re.compile(r"(\d+)(?=\D*$)")
+
+def natural_sort_key(file_name):
+    """
+    Sort key ordering the digit runs of the file name numerically, so that img-9 comes before img-10
+    """
+    return [int(token) if token.isdigit() else token for token in number_pattern.split(file_name)]
+
+def get_frame_number(file_name):
+    """
+    Returns the last number in the file name, None if the file name has no digits
+    """
+    match = frame_number_pattern.search(file_name)
+    return int(match.group(1)) if match is not None else None
+
+def get_frame_hold_counts(list_images):
+    """
+    Returns for each image the number of frames it is held so that missing frame numbers
+    are filled by the previous image, images without a frame number are held for one frame
+    """
+    frame_numbers = [get_frame_number(file_image) for file_image in list_images]
+    hold_counts = []
+    for frame_number, frame_number_next in zip(frame_numbers, frame_numbers[1:] + [None]):
+        if frame_number is None or frame_number_next is None or frame_number_next <= frame_number:
+            hold_counts.append(1)
+        else:
+            hold_counts.append(frame_number_next - frame_number)
+    return hold_counts
+
+class ImageSequenceIndex:
+    def __init__(self, dir_images, img_format, list_images, dir_signature):
+        """
+        Parameters
+        ----------
+        dir_images (str) : full path of the directory with images
+        img_format (str) : image file format
+        list_images (list) : naturally sorted list of image file names
+        dir_signature (tuple) : directory (mtime, size, inode) at scan time, used for invalidation
+        """
+        self.dir_images = dir_images
+        self.img_format = img_format
+        self.list_images = list_images
+        self.dir_signature = dir_signature
+        self.frame_numbers = None
+
+    def __len__(self):
+        return len(self.list_images)
+
+    def get_frame_numbers(self):
+        if self.frame_numbers is None:
+            self.frame_numbers = [get_frame_number(file_image) for file_image in self.list_images]
+        return self.frame_numbers
+
+    def get_gaps(self):
+        """
+        Returns the list of (first_missing, last_missing) frame number ranges missing in the sequence
+        """
+        list_gaps = []
+        frame_numbers = [n for n in self.get_frame_numbers() if n is not None]
+        for frame_prev, frame_next in zip(frame_numbers[:-1], frame_numbers[1:]):
+            if frame_next > frame_prev + 1:
+                list_gaps.append((frame_prev + 1, frame_next - 1))
+        return list_gaps
+
+def get_dir_signature(dir_images):
+    dir_stat = os.stat(dir_images)
+    return (dir_stat.st_mtime_ns, dir_stat.st_size, dir_stat.st_ino)
+
+def scan_image_sequence(dir_images, img_format):
+    """
+    Streams the directory entries with os.scandir and returns a new ImageSequenceIndex
+    """
+    dir_signature = get_dir_signature(dir_images)
+    with os.scandir(dir_images) as dir_entries:
+        list_images = [entry.name for entry in dir_entries if entry.name.endswith(img_format)]
+    list_images.sort(key=natural_sort_key)
+    return ImageSequenceIndex(dir_images, img_format, list_images, dir_signature)
+
+dict_index_cache = {}
+index_cache_lock = threading.Lock()
+
+def get_image_sequence_index(dir_images, img_format):
+    """
+    Returns the cached ImageSequenceIndex of the directory, rescanned only when the directory
+    mtime, size or inode changed, so that many views of the same folder share one scan
+    """
+    key = (os.path.abspath(dir_images), img_format)
+    dir_signature = get_dir_signature(dir_images)
+    with index_cache_lock:
+        image_sequence_index = dict_index_cache.get(key)
+    if image_sequence_index is not None and image_sequence_index.dir_signature == dir_signature:
+        return image_sequence_index
+
+    image_sequence_index = scan_image_sequence(dir_images, img_format)
+    with index_cache_lock:
+        dict_index_cache[key] = image_sequence_index
+    return image_sequence_index
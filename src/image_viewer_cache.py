@@ -0,0 +1,128 @@
+import os
+import sys
+import threading
+import cv2
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from image_sequence_index import get_image_sequence_index
+
+class ImageViewerCache:
+    list_reduce_factors = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2), (1, cv2.IMREAD_COLOR)]
+
+    def __init__(self, dir_images, img_format, max_cache_bytes=512*1024*1024, num_prefetch=4, num_workers=2):
+        """
+        Viewer backend with a cached directory index, an LRU cache of decoded display sized
+        rgb images bounded by bytes, reduced resolution decoding and prefetching of neighbors
+
+        Parameters
+        ----------
+        dir_images (str) : full path of the directory with images
+        img_format (str) : image file format
+        max_cache_bytes (int) : max total size of the cached images
+        num_prefetch (int) : number of images prefetched on each side of the viewed image
+        num_workers (int) : number of threads used for prefetching
+        """
+        self.dir_images = dir_images
+        self.img_format = img_format
+        self.max_cache_bytes = max_cache_bytes
+        self.num_prefetch = num_prefetch
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, num_workers))
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.pending = set()
+        self.image_sequence_index = None
+        self.full_width = None
+
+    def get_list_images(self):
+        """
+        Returns the sorted image list from the shared image sequence index, the decoded
+        images are dropped whenever the index was rescanned
+        """
+        image_sequence_index = get_image_sequence_index(self.dir_images, self.img_format)
+        with self.lock:
+            if image_sequence_index is not self.image_sequence_index:
+                self.image_sequence_index = image_sequence_index
+                self.cache.clear()
+                self.cache_bytes = 0
+                self.full_width = None
+            return image_sequence_index.list_images
+
+    def get_reduce_flag(self, display_width):
+        """
+        Returns the imread flag of the largest reduction keeping the image at least display_width wide
+        """
+        if display_width is None:
+            return cv2.IMREAD_COLOR
+        if self.full_width is None:
+            list_images = self.get_list_images()
+            if len(list_images) == 0:
+                return cv2.IMREAD_COLOR
+            img = cv2.imread(os.path.join(self.dir_images, list_images[0]), cv2.IMREAD_REDUCED_COLOR_8)
+            self.full_width = 8 * img.shape[1] if img is not None else 0
+        for reduce_factor, reduce_flag in self.list_reduce_factors:
+            if self.full_width // reduce_factor >= display_width:
+                return reduce_flag
+        return cv2.IMREAD_COLOR
+
+    def decode_image(self, file_image, reduce_flag):
+        img = cv2.imread(os.path.join(self.dir_images, file_image), reduce_flag)
+        if img is not None:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            img.flags.writeable = False
+        return img
+
+    def add_to_cache(self, key, img):
+        with self.lock:
+            self.pending.discard(key)
+            if img is None or key in self.cache:
+                return
+            self.cache[key] = img
+            self.cache_bytes += img.nbytes
+            while self.cache_bytes > self.max_cache_bytes and len(self.cache) > 1:
+                _, img_evicted = self.cache.popitem(last=False)
+                self.cache_bytes -= img_evicted.nbytes
+        return
+
+    def load_into_cache(self, key):
+        try:
+            img = self.decode_image(*key)
+        except Exception:
+            img = None
+        self.add_to_cache(key, img)
+        return
+
+    def prefetch_neighbors(self, image_id, reduce_flag):
+        list_images = self.image_sequence_index.list_images
+        list_ids = [image_id + offset for k in range(1, self.num_prefetch+1) for offset in (k, -k)]
+        for neighbor_id in list_ids:
+            if not (0 <= neighbor_id < len(list_images)):
+                continue
+            key = (list_images[neighbor_id], reduce_flag)
+            with self.lock:
+                if key in self.cache or key in self.pending:
+                    continue
+                self.pending.add(key)
+            self.executor.submit(self.load_into_cache, key)
+        return
+
+    def get_image(self, image_id, display_width=None):
+        """
+        Returns (file_image, rgb image) of image_id decoded at reduced resolution for display_width,
+        the returned array is shared by the cache and read only
+        """
+        list_images = self.get_list_images()
+        reduce_flag = self.get_reduce_flag(display_width)
+        file_image = list_images[image_id]
+        key = (file_image, reduce_flag)
+        with self.lock:
+            img = self.cache.get(key)
+            if img is not None:
+                self.cache.move_to_end(key)
+        if img is None:
+            img = self.decode_image(file_image, reduce_flag)
+            self.add_to_cache(key, img)
+        self.prefetch_neighbors(image_id, reduce_flag)
+        return file_image, img
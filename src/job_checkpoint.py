@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import numpy as np
+
+from encoder_settings import EncoderSettings
+
+def get_default_checkpoint_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "video_editor_web", "jobs")
+
+def get_params_key(value):
+    """
+    Returns a json serializable key of the param value, arrays are keyed by the hash of their bytes
+    """
+    if isinstance(value, np.ndarray):
+        return {"ndarray": hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest(), "shape": list(value.shape)}
+    if isinstance(value, EncoderSettings):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [get_params_key(item) for item in value]
+    if isinstance(value, dict):
+        return {f"{key}" : get_params_key(item) for key, item in value.items()}
+    if isinstance(value, str) and os.path.sep in value:
+        return os.path.abspath(value)
+    return value
+
+def get_job_id(job_type, dict_params):
+    """
+    Returns the job id of the job type and its params, so that rerunning the same job resumes it
+    """
+    hasher = hashlib.sha1()
+    hasher.update(json.dumps([job_type, get_params_key(dict_params)], sort_keys=True, default=str).encode())
+    return f"{job_type}_{hasher.hexdigest()[:16]}"
+
+class JobCheckpoint:
+    def __init__(self, job_id, dir_checkpoints=None):
+        """
+        Progress of a long running job saved as json in dir_checkpoints, the params of the job are saved
+        along with it so that an unfinished job can be resumed by its id, arrays are saved as .npy files
+
+        Parameters
+        ----------
+        job_id (str) : id of the job, see get_job_id
+        dir_checkpoints (str) : directory of the checkpoint files
+        """
+        self.job_id = job_id
+        self.dir_checkpoints = dir_checkpoints or get_default_checkpoint_dir()
+        self.file_checkpoint = os.path.join(self.dir_checkpoints, f"{job_id}.json")
+        self.state = {"job_id" : job_id, "job_type" : None, "params" : {}, "signature" : None,
+            "time_updated" : None, "data" : {}}
+
+    def exists(self):
+        return os.path.isfile(self.file_checkpoint)
+
+    def load(self):
+        with open(self.file_checkpoint, "r") as file_des:
+            self.state = json.load(file_des)
+        return self
+
+    def save(self):
+        """
+        Writes the checkpoint to a temporary file moved over the previous one, so a crash never leaves a truncated checkpoint
+        """
+        os.makedirs(self.dir_checkpoints, exist_ok=True)
+        self.state["time_updated"] = time.time()
+        file_tmp = f"{self.file_checkpoint}.tmp"
+        with open(file_tmp, "w") as file_des:
+            json.dump(self.state, file_des, indent=2, default=str)
+        os.replace(file_tmp, self.file_checkpoint)
+        return
+
+    def get_file_array(self, name):
+        return os.path.join(self.dir_checkpoints, f"{self.job_id}_{name}.npy")
+
+    def start(self, job_type, dict_params, signature=None, resume=True):
+        """
+        Returns True if the saved progress of the job is resumed, the progress is discarded if resume
+        is False or the signature of the inputs (e.g. the file size and mtime) changed since it was saved
+        """
+        is_resumed = False
+        if resume and self.exists():
+            try:
+                self.load()
+                is_resumed = self.state.get("signature") == signature
+            except (OSError, ValueError):
+                is_resumed = False
+
+        os.makedirs(self.dir_checkpoints, exist_ok=True)
+        params = {}
+        for key, value in dict_params.items():
+            if isinstance(value, np.ndarray):
+                np.save(self.get_file_array(key), value)
+                params[key] = {"ndarray" : key}
+            elif isinstance(value, EncoderSettings):
+                params[key] = {"encoder_settings" : value.to_dict()}
+            else:
+                params[key] = value
+        self.state.update({"job_id" : self.job_id, "job_type" : job_type, "params" : params, "signature" : signature})
+        if not is_resumed:
+            self.state["data"] = {}
+        self.save()
+        return is_resumed
+
+    def get_params(self):
+        """
+        Returns the params of the job with arrays and encoder settings restored
+        """
+        dict_params = {}
+        for key, value in self.state["params"].items():
+            if isinstance(value, dict) and "ndarray" in value:
+                value = np.load(self.get_file_array(value["ndarray"]))
+            elif isinstance(value, dict) and "encoder_settings" in value:
+                value = EncoderSettings.from_dict(value["encoder_settings"])
+            dict_params[key] = value
+        return dict_params
+
+    def get(self, key, default=None):
+        return self.state["data"].get(key, default)
+
+    def update(self, **kwargs):
+        self.state["data"].update(kwargs)
+        self.save()
+        return
+
+    def get_segment_files(self, name, signature=None):
+        """
+        Returns the file names of the named segment, None if the segment is not done
+        or its inputs changed since, i.e. it was done with another signature
+        """
+        segment = self.state["data"].get("segments", {}).get(name)
+        if not isinstance(segment, dict) or segment.get("signature") != signature:
+            return None
+        return segment["files"]
+
+    def set_segment_files(self, name, list_files, signature=None):
+        self.state["data"].setdefault("segments", {})[name] = {"files" : list_files, "signature" : signature}
+        self.save()
+        return
+
+    def finish(self):
+        """
+        Removes the checkpoint and the saved arrays of the finished job
+        """
+        for value in self.state["params"].values():
+            if isinstance(value, dict) and "ndarray" in value and os.path.isfile(self.get_file_array(value["ndarray"])):
+                os.unlink(self.get_file_array(value["ndarray"]))
+        if self.exists():
+            os.unlink(self.file_checkpoint)
+        return
+
+def get_files_signature(list_files):
+    """
+    Returns a hash of the names, sizes and mtimes of the files, so that edited files are detected without reading them
+    """
+    hasher = hashlib.sha1()
+    for file_path in list_files:
+        file_stat = os.stat(file_path)
+        hasher.update(f"{os.path.basename(file_path)}|{file_stat.st_size}|{file_stat.st_mtime_ns}\n".encode())
+    return hasher.hexdigest()
+
+def list_job_checkpoints(dir_checkpoints=None):
+    """
+    Returns the checkpoints of the unfinished jobs, most recently updated first
+    """
+    dir_checkpoints = dir_checkpoints or get_default_checkpoint_dir()
+    if not os.path.isdir(dir_checkpoints):
+        return []
+    list_checkpoints = []
+    for file_name in os.listdir(dir_checkpoints):
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            list_checkpoints.append(JobCheckpoint(file_name[:-len(".json")], dir_checkpoints=dir_checkpoints).load())
+        except (OSError, ValueError):
+            continue
+    list_checkpoints.sort(key=lambda job_checkpoint: job_checkpoint.state.get("time_updated") or 0, reverse=True)
+    return list_checkpoints
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+class PipelineStats:
+    def __init__(self):
+        """
+        Thread safe record of per stage cumulative time, frame counts and queue depths of a pipeline,
+        stages timed in worker threads add up, so stage times can exceed the elapsed wall time
+        """
+        self.lock = threading.Lock()
+        self.time_start = time.perf_counter()
+        self.num_frames = 0
+        self.stage_times = {}
+        self.stage_counts = {}
+        self.queue_depths = {}
+        self.queue_depths_max = {}
+        self.encoder_progress = {}
+
+    @contextmanager
+    def time_stage(self, stage):
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, time.perf_counter() - time_start)
+
+    def add_stage_time(self, stage, time_elapsed, count=1):
+        with self.lock:
+            self.stage_times[stage] = self.stage_times.get(stage, 0.0) + time_elapsed
+            self.stage_counts[stage] = self.stage_counts.get(stage, 0) + count
+        return
+
+    def set_queue_depth(self, queue_name, depth):
+        with self.lock:
+            self.queue_depths[queue_name] = depth
+            self.queue_depths_max[queue_name] = max(depth, self.queue_depths_max.get(queue_name, 0))
+        return
+
+    def set_encoder_progress(self, ffmpeg_progress):
+        """
+        Records the live frame, fps and speed reported by ffmpeg through -progress
+        """
+        with self.lock:
+            self.encoder_progress = {"frame" : ffmpeg_progress.frame, "fps" : ffmpeg_progress.fps,
+                "speed" : ffmpeg_progress.speed, "out_time_sec" : ffmpeg_progress.out_time_sec,
+                "total_size" : ffmpeg_progress.total_size}
+        return
+
+    def add_frames(self, num_frames=1):
+        with self.lock:
+            self.num_frames += num_frames
+        return
+
+    def get_summary(self):
+        with self.lock:
+            time_elapsed = time.perf_counter() - self.time_start
+            summary = {
+                "time_elapsed" : time_elapsed,
+                "num_frames" : self.num_frames,
+                "fps" : self.num_frames / time_elapsed if time_elapsed > 0 else 0.0,
+                "stages" : {},
+                "queues" : {},
+                "encoder" : dict(self.encoder_progress),
+            }
+            for stage, stage_time in self.stage_times.items():
+                count = self.stage_counts[stage]
+                summary["stages"][stage] = {
+                    "time" : stage_time,
+                    "count" : count,
+                    "time_per_item" : stage_time / count if count > 0 else 0.0,
+                    "items_per_sec" : count / stage_time if stage_time > 0 else 0.0,
+                }
+            for queue_name, depth in self.queue_depths.items():
+                summary["queues"][queue_name] = {"depth" : depth, "depth_max" : self.queue_depths_max[queue_name]}
+        return summary
+
+class ThrottledProgress:
+    def __init__(self, progress_callback=None, num_total=1, max_updates_per_sec=4.0, pipeline_stats=None, stats_callback=None):
+        """
+        Forwards progress to the callbacks at most max_updates_per_sec times per second,
+        usable with streamlit widgets as well as with plain logging in headless runs
+
+        Parameters
+        ----------
+        progress_callback (callable) : called with the completed fraction in [0, 1]
+        num_total (int) : total number of items
+        max_updates_per_sec (float) : max rate of callback calls
+        pipeline_stats (PipelineStats) : stats whose summary is passed to stats_callback
+        stats_callback (callable) : called with the pipeline stats summary dict
+        """
+        self.progress_callback = progress_callback
+        self.num_total = max(1, num_total)
+        self.time_interval = 1.0 / max_updates_per_sec if max_updates_per_sec > 0 else 0.0
+        self.pipeline_stats = pipeline_stats
+        self.stats_callback = stats_callback
+        self.time_last_update = None
+
+    def update(self, num_done, force=False):
+        time_now = time.perf_counter()
+        if not force and self.time_last_update is not None and time_now - self.time_last_update < self.time_interval:
+            return
+        self.time_last_update = time_now
+        if self.progress_callback is not None:
+            self.progress_callback(min(1.0, num_done / self.num_total))
+        if self.stats_callback is not None and self.pipeline_stats is not None:
+            self.stats_callback(self.pipeline_stats.get_summary())
+        return
+
+    def finish(self):
+        self.update(self.num_total, force=True)
+        return
@@ -0,0 +1,639 @@
+"""
+UI independent implementations of the editor modes, used by both the streamlit app and the batch runner.
+Failures are raised as FileNotFoundError (missing inputs), ValueError (invalid inputs) or RuntimeError (ffmpeg errors).
+"""
+
+import os
+import sys
+import shutil
+import time
+import threading
+import cv2
+import numpy as np
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+from file_utils import get_list_images, create_directory, atomic_output_file
+from image_sequence_index import get_frame_hold_counts
+from video_utils_ffmpeg import FFMPEGImageToVideoWriter, FFMPEGSavedImageToVideoWriter, FFMPEGChunkedImageToVideoWriter
+from video_utils_ffmpeg import FFMPEGStillImageSegmentWriter, FFMPEGVideoConcatenator, FFMPEGPrologueEpilogueWriter, get_ffmpeg_scale_filter
+from video_utils_ffmpeg import FFMPEGVideoReader, probe_video_info, probe_keyframe_ids
+from utils_opencv import VideoWriter, VideoReader, ImagePrefetcher, ImageWriterPool, FrameNormalizer, iter_fade_frames
+from utils_opencv import VideoFramePrefetcher, TextOverlay, SceneChangeDetector
+from pipeline_stats import PipelineStats, ThrottledProgress
+from encoder_settings import EncoderSettings
+from job_checkpoint import JobCheckpoint, get_job_id, get_files_signature
+
+def log_message(log_callback, message):
+    if log_callback is not None:
+        log_callback(message)
+    return
+
+def get_pipeline_progress(progress_callback, num_total, pipeline_stats=None, stats_callback=None):
+    """
+    Returns (pipeline_stats, progress), a new PipelineStats is created if none is given
+    """
+    if pipeline_stats is None:
+        pipeline_stats = PipelineStats()
+    progress = ThrottledProgress(progress_callback, num_total, pipeline_stats=pipeline_stats,
+        stats_callback=stats_callback)
+    return pipeline_stats, progress
+
+def prepare_output_file(file_video, log_callback=None):
+    """
+    Creates the output directory, an existing video is kept until the new one is complete, see atomic_output_file
+    """
+    dir_out = os.path.dirname(file_video)
+    if not os.path.isdir(dir_out):
+        _ = create_directory(dir_out)
+        log_message(log_callback, f"Created directory : {dir_out}")
+
+    if os.path.isfile(file_video):
+        log_message(log_callback, f"Existing video is replaced when the new one is complete : {file_video}")
+    return
+
+def start_job_checkpoint(job_type, dict_params, list_tuning_params, signature, job_id=None, resume=True, log_callback=None):
+    """
+    Returns (job_checkpoint, is_resumed), by default the job id is derived from the params
+    except list_tuning_params, which only affect the speed of the job
+    """
+    if job_id is None:
+        job_id = get_job_id(job_type, {key : value for key, value in dict_params.items() if key not in list_tuning_params})
+    job_checkpoint = JobCheckpoint(job_id)
+    is_resumed = job_checkpoint.start(job_type, dict_params, signature=signature, resume=resume)
+    log_message(log_callback, f"{'Resuming' if is_resumed else 'Starting'} job : {job_id}")
+    return job_checkpoint, is_resumed
+
+def get_checkpointed_segment(job_checkpoint, dir_segments, name, encode_segment, signature=None):
+    """
+    Returns the files of the named segment, encode_segment is only called when the segment is not done
+    in the checkpoint with the same signature of its inputs or one of its files is missing, and must
+    return the list of files it encoded
+    """
+    list_files = job_checkpoint.get_segment_files(name, signature=signature)
+    if list_files is not None and all(os.path.isfile(os.path.join(dir_segments, file_name)) for file_name in list_files):
+        return [os.path.join(dir_segments, file_name) for file_name in list_files]
+    list_files_segments = encode_segment()
+    job_checkpoint.set_segment_files(name, [os.path.basename(file_segment) for file_segment in list_files_segments], signature=signature)
+    return list_files_segments
+
+def get_image_list_checked(dir_images, img_format, fps, start_index=0, end_index=None, num_extra_frames=0):
+    """
+    Returns the naturally sorted images of dir_images in the index range [start_index, end_index),
+    the images together with num_extra_frames (e.g. of titles) must make more than fps frames
+    """
+    if not os.path.isdir(dir_images):
+        raise FileNotFoundError(f"Not found, images dir : {dir_images}")
+    list_images = get_list_images(dir_images, img_format)[start_index:end_index]
+    if len(list_images) == 0 or len(list_images) + num_extra_frames <= fps:
+        raise ValueError(f"Num images : {len(list_images)}, not enough")
+    return list_images
+
+def get_video_reader(file_video, reader_backend="opencv", num_decode_threads=0, num_buffers=4):
+    """
+    Returns an initialized video reader, "opencv" for cv2.VideoCapture or "ffmpeg" for the ffmpeg rawvideo
+    pipe with num_decode_threads decoder threads, an exact frame count and num_buffers ring buffers
+    """
+    if reader_backend == "opencv":
+        video_reader = VideoReader(file_video)
+    elif reader_backend == "ffmpeg":
+        video_reader = FFMPEGVideoReader(file_video, num_threads=num_decode_threads, num_buffers=num_buffers)
+    else:
+        raise ValueError(f"Unknown video reader backend : {reader_backend}, valid backends : ['opencv', 'ffmpeg']")
+    video_reader.init_video_reader()
+    return video_reader
+
+def get_image_dimensions(dir_images, file_image):
+    img = cv2.imread(os.path.join(dir_images, file_image))
+    if img is None:
+        raise ValueError(f"Failed to read image : {file_image}")
+    return img.shape[1], img.shape[0]
+
+def saved_images_to_video_ffmpeg(dir_images, file_video, fps=30, crf=23, img_format=".png", video_encoder="libx264", num_chunks=1,
+    encoder_settings=None, start_index=0, end_index=None, fill_gaps=False, timeout=None,
+    log_callback=None, progress_callback=None, pipeline_stats=None, stats_callback=None):
+    """
+    Encodes the saved images with a single ffmpeg process, or with num_chunks parallel
+    ffmpeg processes whose GOP aligned chunks are concatenated without re-encoding,
+    the live frame, fps and speed reported by ffmpeg are forwarded to the callbacks from the calling thread.
+    The images are read through an ffconcat list of the index range [start_index, end_index),
+    missing frame numbers are skipped, or filled by holding the previous image if fill_gaps is True
+    """
+    list_images = get_image_list_checked(dir_images, img_format, fps, start_index=start_index, end_index=end_index)
+    hold_counts = get_frame_hold_counts(list_images) if fill_gaps else [1] * len(list_images)
+    num_frames = sum(hold_counts)
+    prepare_output_file(file_video, log_callback=log_callback)
+
+    with atomic_output_file(file_video) as file_video_partial:
+        if num_chunks > 1:
+            list_images_held = [file_image for file_image, hold_count in zip(list_images, hold_counts) for _ in range(hold_count)]
+            ffmpeg_video_writer = FFMPEGChunkedImageToVideoWriter(dir_images, list_images_held, file_video_partial,
+                fps=fps, crf=crf, video_encoder=video_encoder, num_chunks=num_chunks, encoder_settings=encoder_settings)
+        else:
+            ffmpeg_video_writer = FFMPEGSavedImageToVideoWriter(fps=fps, crf=crf,
+                file_video=file_video_partial, dir_images=dir_images, img_format=img_format,
+                video_encoder=video_encoder, encoder_settings=encoder_settings,
+                list_images=list_images, hold_counts=hold_counts)
+        log_message(log_callback, ffmpeg_video_writer.ffmpeg_params)
+
+        log_message(log_callback, f"Images dir : {dir_images}")
+        log_message(log_callback, f"Starting video generation with {len(list_images)} images, {num_frames} frames")
+        pipeline_stats, progress = get_pipeline_progress(progress_callback, num_frames,
+            pipeline_stats=pipeline_stats, stats_callback=stats_callback)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(ffmpeg_video_writer.generate_video_from_saved_images,
+                progress_callback=pipeline_stats.set_encoder_progress, timeout=timeout)
+            while not future.done():
+                time.sleep(progress.time_interval or 0.25)
+                progress.update(pipeline_stats.get_summary()["encoder"].get("frame", 0))
+            future.result()
+        pipeline_stats.add_frames(num_frames)
+        progress.finish()
+        if not os.path.isfile(file_video_partial):
+            raise RuntimeError(f"ffmpeg failed to create the video : {file_video}")
+    return len(list_images)
+
+def encode_title_segments(dir_segments, name, title_img, num_frames, fps, width, height, encoder_settings, file_ext=".mp4", num_fade_frames=0):
+    """
+    Encodes the title card held for num_frames, with optional fade in and fade out from black,
+    and returns the ordered list of segment files, the held part is sent to ffmpeg only once
+    """
+    num_fade_frames = min(num_fade_frames, num_frames // 3)
+    list_files_segments = []
+
+    def encode_fade_segment(file_segment, fade_in):
+        ffmpeg_video_writer = FFMPEGImageToVideoWriter(fps=fps, width=width, height=height,
+            file_video=file_segment, encoder_settings=encoder_settings)
+        ffmpeg_video_writer.open_ffmpeg_process()
+        for frames in iter_fade_frames(title_img, num_fade_frames, fade_in=fade_in):
+            for frame in frames:
+                ffmpeg_video_writer.write_image_to_video(frame)
+        ffmpeg_video_writer.close_ffmpeg_process()
+        list_files_segments.append(file_segment)
+        return
+
+    if num_fade_frames > 0:
+        encode_fade_segment(os.path.join(dir_segments, f"{name}_fade_in{file_ext}"), True)
+
+    file_hold = os.path.join(dir_segments, f"{name}{file_ext}")
+    FFMPEGStillImageSegmentWriter(fps=fps, width=width, height=height,
+        file_video=file_hold, encoder_settings=encoder_settings).write_still_image(
+        title_img, num_frames - 2 * num_fade_frames)
+    list_files_segments.append(file_hold)
+
+    if num_fade_frames > 0:
+        encode_fade_segment(os.path.join(dir_segments, f"{name}_fade_out{file_ext}"), False)
+    return list_files_segments
+
+def streaming_images_to_video_ffmpeg(dir_images, file_video, fps=30, width=640, height=480, img_format=".png", video_encoder="libx264",
+    prologue_img=None, num_prologue_sec=0, epilogue_img=None, num_epilogue_sec=0, num_fade_sec=0, num_decode_workers=4, prefetch_depth=16,
+    encoder_settings=None, fit_mode="letterbox", interpolation="area", scale_in_ffmpeg=False, num_segment_images=1800, job_id=None, resume=True,
+    log_callback=None, progress_callback=None, pipeline_stats=None, stats_callback=None):
+    """
+    Encodes the images in dir_images through the ffmpeg pipe, prologue, epilogue and blank
+    segments are encoded separately as still image segments and concatenated with the images,
+    titles fade in from and out to black over num_fade_sec.
+    Every image is converted to width x height with fit_mode, with scale_in_ffmpeg the images are
+    sent at the size of the first image and scaled by the ffmpeg filter graph in the encoder threads.
+    The images are encoded in segments of num_segment_images next to file_video, every finished segment
+    is recorded in the checkpoint of job_id (derived from the params by default), so a rerun of the job
+    only encodes the unfinished segments before the final concat, with resume False the job starts over
+    """
+    has_static_segments = (num_prologue_sec > 0) or (num_epilogue_sec > 0)
+    num_images_prologue = int(round(num_prologue_sec * fps))
+    num_images_epilogue = int(round(num_epilogue_sec * fps))
+    num_images_blank = fps * ((num_prologue_sec > 0) + (num_epilogue_sec > 0))
+    list_images = get_image_list_checked(dir_images, img_format, fps,
+        num_extra_frames=num_images_prologue + num_images_epilogue + num_images_blank)
+    img_width, img_height = get_image_dimensions(dir_images, list_images[0])
+    if encoder_settings is None:
+        encoder_settings = EncoderSettings(video_encoder=video_encoder)
+    if num_segment_images < 1:
+        raise ValueError(f"Num segment images must be at least 1, got {num_segment_images}")
+    num_images_dir = len(list_images)
+    num_images = num_images_prologue + num_images_dir + num_images_epilogue + num_images_blank
+    pipeline_stats, progress = get_pipeline_progress(progress_callback, num_images_dir,
+        pipeline_stats=pipeline_stats, stats_callback=stats_callback)
+
+    prepare_output_file(file_video, log_callback=log_callback)
+    dict_params = {"dir_images" : dir_images, "file_video" : file_video, "fps" : fps, "width" : width, "height" : height,
+        "img_format" : img_format, "prologue_img" : prologue_img, "num_prologue_sec" : num_prologue_sec,
+        "epilogue_img" : epilogue_img, "num_epilogue_sec" : num_epilogue_sec, "num_fade_sec" : num_fade_sec,
+        "num_decode_workers" : num_decode_workers, "prefetch_depth" : prefetch_depth, "encoder_settings" : encoder_settings,
+        "fit_mode" : fit_mode, "interpolation" : interpolation, "scale_in_ffmpeg" : scale_in_ffmpeg,
+        "num_segment_images" : num_segment_images}
+    job_checkpoint, is_resumed = start_job_checkpoint("streaming_images_to_video_ffmpeg", dict_params,
+        ["num_decode_workers", "prefetch_depth"], [num_images_dir, list_images[0], list_images[-1]],
+        job_id=job_id, resume=resume, log_callback=log_callback)
+
+    dir_segments = os.path.join(os.path.dirname(file_video), f".segments_{job_checkpoint.job_id}")
+    if not is_resumed:
+        shutil.rmtree(dir_segments, ignore_errors=True)
+    _ = create_directory(dir_segments)
+    file_ext = os.path.splitext(file_video)[1]
+    num_fade_frames = int(round(num_fade_sec * fps))
+
+    frame_width, frame_height, video_filter = width, height, None
+    if scale_in_ffmpeg and (img_width, img_height) != (width, height):
+        frame_width, frame_height = img_width, img_height
+        video_filter = get_ffmpeg_scale_filter(width, height, fit_mode=fit_mode, interpolation=interpolation)
+    frame_normalizer = FrameNormalizer(frame_width, frame_height, fit_mode=fit_mode, interpolation=interpolation,
+        pipeline_stats=pipeline_stats)
+
+    def get_main_writer(file_segment):
+        return FFMPEGImageToVideoWriter(fps=fps, width=frame_width, height=frame_height,
+            file_video=file_segment, encoder_settings=encoder_settings, video_filter=video_filter)
+
+    def encode_blank_segment():
+        file_blank = os.path.join(dir_segments, "blank" + file_ext)
+        with pipeline_stats.time_stage("encode_still_segment"):
+            FFMPEGStillImageSegmentWriter(fps=fps, width=width, height=height,
+                file_video=file_blank, encoder_settings=encoder_settings).write_still_image(
+                np.zeros((height, width, 3), dtype=np.uint8), fps)
+        return [file_blank]
+
+    def encode_title_segment(name, title_img, num_frames):
+        with pipeline_stats.time_stage("encode_still_segment"):
+            return encode_title_segments(dir_segments, name, title_img, num_frames, fps, width, height,
+                encoder_settings, file_ext=file_ext, num_fade_frames=num_fade_frames)
+
+    def encode_main_segment(file_segment, list_images_segment, num_done):
+        ffmpeg_video_writer = get_main_writer(file_segment)
+        ffmpeg_video_writer.open_ffmpeg_process(progress_callback=pipeline_stats.set_encoder_progress)
+        image_prefetcher = ImagePrefetcher(dir_images, list_images_segment,
+            num_workers=num_decode_workers, prefetch_depth=prefetch_depth, pipeline_stats=pipeline_stats)
+        try:
+            for i, (file_image, img) in enumerate(image_prefetcher):
+                if img is None:
+                    raise ValueError(f"Failed to read image : {file_image}")
+                img = frame_normalizer(img)
+                with pipeline_stats.time_stage("pipe_write"):
+                    ffmpeg_video_writer.write_image_to_video(img)
+                pipeline_stats.add_frames()
+                progress.update(num_done + i + 1)
+        finally:
+            with pipeline_stats.time_stage("encode_flush"):
+                ffmpeg_video_writer.close_ffmpeg_process()
+        return [file_segment]
+
+    log_message(log_callback, get_main_writer(file_video).ffmpeg_params)
+    log_message(log_callback, f"Images dir : {dir_images}")
+    log_message(log_callback, f"Starting video generation with {num_images} images in segments of {num_segment_images} images")
+    list_files_segments = []
+    list_files_blank = []
+    if has_static_segments:
+        list_files_blank = get_checkpointed_segment(job_checkpoint, dir_segments, "blank", encode_blank_segment)
+
+    if num_prologue_sec > 0:
+        list_files_segments += get_checkpointed_segment(job_checkpoint, dir_segments, "prologue",
+            lambda: encode_title_segment("prologue", prologue_img, num_images_prologue))
+        list_files_segments += list_files_blank
+
+    num_segments_resumed = 0
+    for segment_start in range(0, num_images_dir, num_segment_images):
+        name = f"main_{segment_start // num_segment_images:05d}"
+        list_images_segment = list_images[segment_start:segment_start + num_segment_images]
+        segment_signature = get_files_signature([os.path.join(dir_images, file_image) for file_image in list_images_segment])
+        num_segments_resumed += job_checkpoint.get_segment_files(name, signature=segment_signature) is not None
+        list_files_segments += get_checkpointed_segment(job_checkpoint, dir_segments, name,
+            lambda: encode_main_segment(os.path.join(dir_segments, name + file_ext), list_images_segment, segment_start),
+            signature=segment_signature)
+        progress.update(segment_start + len(list_images_segment))
+    progress.finish()
+    if num_segments_resumed > 0:
+        log_message(log_callback, f"Skipped {num_segments_resumed} segments encoded before")
+    if frame_normalizer.num_normalized > 0:
+        log_message(log_callback, f"Converted {frame_normalizer.num_normalized} images to {frame_width}x{frame_height} ({fit_mode})")
+
+    if num_epilogue_sec > 0:
+        list_files_segments += list_files_blank
+        list_files_segments += get_checkpointed_segment(job_checkpoint, dir_segments, "epilogue",
+            lambda: encode_title_segment("epilogue", epilogue_img, num_images_epilogue))
+
+    if len(list_files_segments) == 1:
+        os.replace(list_files_segments[0], file_video)
+    else:
+        with atomic_output_file(file_video) as file_video_partial:
+            with pipeline_stats.time_stage("concat"):
+                FFMPEGVideoConcatenator(list_files_segments, file_video_partial).concat_videos()
+    job_checkpoint.finish()
+    shutil.rmtree(dir_segments, ignore_errors=True)
+    return num_images
+
+def add_prologue_epilogue_to_video_ffmpeg(file_video_in, file_video_out, prologue_img=None, num_prologue_sec=0,
+    epilogue_img=None, num_epilogue_sec=0, log_callback=None):
+    if not os.path.isfile(file_video_in):
+        raise FileNotFoundError(f"Not found, video file: {file_video_in}")
+    if file_video_out == file_video_in:
+        raise ValueError("Video file to be created must differ from the video file to load")
+    if (num_prologue_sec == 0) and (num_epilogue_sec == 0):
+        raise ValueError("Prologue and epilogue are both 0 sec., nothing to add")
+
+    prepare_output_file(file_video_out, log_callback=log_callback)
+    with atomic_output_file(file_video_out) as file_video_partial:
+        ffmpeg_title_writer = FFMPEGPrologueEpilogueWriter(file_video_in, file_video_partial)
+        ffmpeg_title_writer.add_prologue_epilogue(prologue_img=prologue_img, num_prologue_sec=num_prologue_sec,
+            epilogue_img=epilogue_img, num_epilogue_sec=num_epilogue_sec)
+    return
+
+def transform_video_ffmpeg(file_video_in, file_video_out, start_sec=0, end_sec=None, width=None, height=None, fit_mode="letterbox",
+    interpolation="area", overlay_text=None, overlay_position=(20, 40), font=cv2.FONT_HERSHEY_SIMPLEX, font_scale=1, color_text="white",
+    list_operations=None, keep_audio=True, max_queue_size=16, video_encoder="libx264", encoder_settings=None,
+    reader_backend="opencv", num_decode_threads=0, log_callback=None, progress_callback=None, pipeline_stats=None, stats_callback=None):
+    """
+    Decodes the video in a background thread, applies the frame operations and encodes the frames
+    through the ffmpeg pipe, the frames stay in memory in a bounded queue and no image files are written.
+    The video is trimmed to [start_sec, end_sec), the frames are converted to width x height (the source
+    size by default), then the overlay text and list_operations (callables taking and returning a bgr
+    frame) are applied in order. The video is decoded with reader_backend, see get_video_reader.
+    Returns the number of frames encoded
+    """
+    if not os.path.isfile(file_video_in):
+        raise FileNotFoundError(f"Not found, video file: {file_video_in}")
+    if os.path.abspath(file_video_out) == os.path.abspath(file_video_in):
+        raise ValueError("Video file to be created must differ from the video file to load")
+    video_info = probe_video_info(file_video_in)
+    start_frame = int(round(start_sec * video_info.fps_value))
+    end_frame = None if end_sec is None else int(round(end_sec * video_info.fps_value))
+    if end_frame is not None and end_frame <= start_frame:
+        raise ValueError(f"End time {end_sec} sec. must be after the start time {start_sec} sec.")
+    width = width or video_info.width
+    height = height or video_info.height
+    if encoder_settings is None:
+        encoder_settings = EncoderSettings(video_encoder=video_encoder)
+
+    video_reader = get_video_reader(file_video_in, reader_backend=reader_backend, num_decode_threads=num_decode_threads,
+        num_buffers=max_queue_size + 3)
+    num_frames = (end_frame or video_reader.get_num_images_in_video()) - start_frame
+    pipeline_stats, progress = get_pipeline_progress(progress_callback, num_frames,
+        pipeline_stats=pipeline_stats, stats_callback=stats_callback)
+    frame_normalizer = FrameNormalizer(width, height, fit_mode=fit_mode, interpolation=interpolation,
+        pipeline_stats=pipeline_stats)
+    list_operations = list(list_operations or [])
+    if overlay_text:
+        list_operations.insert(0, TextOverlay(overlay_text, overlay_position, font=font, font_scale=font_scale, color_text=color_text))
+
+    extra_input_args, extra_output_args = [], []
+    if keep_audio and video_info.has_audio:
+        # the audio is trimmed and padded to the duration of the encoded frames, -shortest with audio trimmed
+        # to end_sec - start_sec cut the last frame whenever the frame durations did not add up exactly
+        num_audio_sec = num_frames / video_info.fps_value
+        extra_input_args = ["-ss", f"{start_sec}", "-t", f"{num_audio_sec:.6f}", "-i", file_video_in]
+        extra_output_args = ["-map", "0:v", "-map", "1:a", "-af", f"apad=whole_dur={num_audio_sec:.6f}", "-c:a", "aac"]
+    prepare_output_file(file_video_out, log_callback=log_callback)
+    log_message(log_callback, f"Transforming frames {start_frame} to {start_frame + num_frames} of {file_video_in}")
+    num_written = 0
+    try:
+        with atomic_output_file(file_video_out) as file_video_partial:
+            ffmpeg_video_writer = FFMPEGImageToVideoWriter(fps=video_info.fps, width=width, height=height,
+                file_video=file_video_partial, encoder_settings=encoder_settings,
+                extra_input_args=extra_input_args, extra_output_args=extra_output_args)
+            log_message(log_callback, ffmpeg_video_writer.ffmpeg_params)
+            ffmpeg_video_writer.open_ffmpeg_process(progress_callback=pipeline_stats.set_encoder_progress)
+            try:
+                with VideoFramePrefetcher(video_reader, start=start_frame, end=end_frame,
+                    max_queue_size=max_queue_size, pipeline_stats=pipeline_stats) as frame_prefetcher:
+                    for _, img in frame_prefetcher:
+                        img = frame_normalizer(img)
+                        with pipeline_stats.time_stage("frame_operations"):
+                            for operation in list_operations:
+                                img = operation(img)
+                        with pipeline_stats.time_stage("pipe_write"):
+                            ffmpeg_video_writer.write_image_to_video(img)
+                        num_written += 1
+                        pipeline_stats.add_frames()
+                        progress.update(num_written)
+            finally:
+                with pipeline_stats.time_stage("encode_flush"):
+                    ffmpeg_video_writer.close_ffmpeg_process()
+            if num_written == 0:
+                raise ValueError(f"No frames decoded from {file_video_in} in the range {start_sec} - {end_sec} sec.")
+    finally:
+        video_reader.close_video_reader()
+    progress.finish()
+    return num_written
+
+def images_to_video_opencv(dir_images, file_video, fps=30, width=640, height=480, img_format=".png", video_encoder="mp4v",
+    fit_mode="letterbox", interpolation="area", log_callback=None, progress_callback=None, pipeline_stats=None, stats_callback=None):
+    list_images = get_image_list_checked(dir_images, img_format, fps)
+    prepare_output_file(file_video, log_callback=log_callback)
+    num_images = len(list_images)
+
+    pipeline_stats, progress = get_pipeline_progress(progress_callback, num_images,
+        pipeline_stats=pipeline_stats, stats_callback=stats_callback)
+    frame_normalizer = FrameNormalizer(width, height, fit_mode=fit_mode, interpolation=interpolation,
+        pipeline_stats=pipeline_stats)
+    with atomic_output_file(file_video) as file_video_partial:
+        opencv_video_writer = VideoWriter(fps=fps, width=width, height=height,
+            file_video=file_video_partial, video_encoder=video_encoder)
+        log_message(log_callback, opencv_video_writer.params)
+        log_message(log_callback, f"Images dir : {dir_images}")
+        log_message(log_callback, f"Starting video generation with {num_images} images")
+
+        opencv_video_writer.init_video_writer()
+        try:
+            for i in range(num_images):
+                with pipeline_stats.time_stage("decode"):
+                    img = cv2.imread(os.path.join(dir_images, list_images[i]))
+                if img is None:
+                    raise ValueError(f"Failed to read image : {list_images[i]}")
+                img = frame_normalizer(img)
+                with pipeline_stats.time_stage("encode_write"):
+                    opencv_video_writer.write_image_to_video(img)
+                pipeline_stats.add_frames()
+                progress.update(i+1)
+        finally:
+            opencv_video_writer.close_video_writer()
+    progress.finish()
+    return num_images
+
+def iter_selected_frames(video_reader, file_video, start_frame, end_frame, stride=1, keyframes_only=False,
+    scene_threshold=None, scene_width=64, resume_frame=None, pipeline_stats=None):
+    """
+    Yields (n, img, num_done) for the frames selected from [start_frame, end_frame), num_done counts
+    the candidate frames, every stride-th frame or keyframe is a candidate, with scene_threshold only
+    candidates differing from the previous candidate by more than scene_threshold are selected.
+    With resume_frame the candidates before it are skipped but counted in num_done, the last one
+    is still decoded as the reference of the scene change detection
+    """
+    if keyframes_only:
+        list_keyframe_ids = [n for n in probe_keyframe_ids(file_video, fps=video_reader.get_fps()) if start_frame <= n < end_frame]
+        list_candidate_ids = list_keyframe_ids[::stride]
+    else:
+        list_candidate_ids = range(start_frame, end_frame, stride)
+    num_skipped = 0 if resume_frame is None else bisect_left(list_candidate_ids, resume_frame)
+    num_first = max(0, num_skipped - 1) if scene_threshold is not None else num_skipped
+
+    if keyframes_only:
+        iter_frames = ((n, img) for i, (n, img) in enumerate(video_reader.iter_keyframes(list_keyframe_ids[num_first * stride:]))
+            if i % stride == 0)
+    else:
+        iter_frames = video_reader.iter_images(start_frame + num_first * stride, end_frame, stride=stride)
+
+    scene_change_detector = SceneChangeDetector(scene_threshold, width=scene_width) if scene_threshold is not None else None
+    num_done = num_first
+    while True:
+        with pipeline_stats.time_stage("decode"):
+            n, img = next(iter_frames, (None, None))
+        if n is None:
+            break
+        num_done += 1
+        if scene_change_detector is not None:
+            with pipeline_stats.time_stage("scene_detect"):
+                is_selected = scene_change_detector.is_scene_change(img)
+            if not is_selected:
+                continue
+        if num_done <= num_skipped:
+            continue
+        yield n, img, num_done
+    return
+
+def is_image_written(file_image):
+    """
+    Images are written atomically by ImageWriterPool, so an existing non empty image file is complete
+    """
+    return os.path.isfile(file_image) and os.path.getsize(file_image) > 0
+
+def video_to_images_opencv(file_video, dir_images, img_prefix="image-", img_format=".png", img_id_start=10000,
+    num_write_workers=4, max_queue_size=32, png_compression=3, jpeg_quality=95, reader_backend="opencv", num_decode_threads=0,
+    start_sec=0, end_sec=None, stride=1, keyframes_only=False, scene_threshold=None, scene_width=64, job_id=None, resume=True,
+    checkpoint_interval=5.0, log_callback=None, progress_callback=None, pipeline_stats=None, stats_callback=None):
+    """
+    Returns the number of images written, failures to write individual images are raised
+    as a RuntimeError listing every failed file, the video is decoded with reader_backend, see get_video_reader.
+    Only the frames of [start_sec, end_sec) are extracted, every stride-th frame, or every stride-th keyframe
+    if keyframes_only is True, with scene_threshold (mean absolute difference in [0, 1] of frames downscaled
+    to scene_width) only scene changes are written. Image names keep the frame id of the video.
+    Every checkpoint_interval sec. the frame before which all images are written is saved in the checkpoint
+    of job_id (derived from the params by default), a rerun of the job continues from that frame and skips
+    the images already written, with resume False the job starts over
+    """
+    if not os.path.isfile(file_video):
+        raise FileNotFoundError(f"Not found, video file: {file_video}")
+    if stride < 1:
+        raise ValueError(f"Stride must be at least 1, got {stride}")
+
+    video_reader = get_video_reader(file_video, reader_backend=reader_backend, num_decode_threads=num_decode_threads,
+        num_buffers=max_queue_size + num_write_workers + 2)
+
+    if not os.path.isdir(dir_images):
+        _ = create_directory(dir_images)
+        log_message(log_callback, f"Created directory : {dir_images}")
+
+    num_images = video_reader.get_num_images_in_video()
+    fps = video_reader.get_fps()
+    start_frame = int(round(start_sec * fps))
+    end_frame = num_images if end_sec is None else min(num_images, int(round(end_sec * fps)))
+    if end_frame <= start_frame:
+        video_reader.close_video_reader()
+        raise ValueError(f"No frames in the range {start_sec} - {end_sec} sec. of {file_video}")
+    num_candidates = (end_frame - start_frame + stride - 1) // stride
+    log_message(log_callback, f"Video file : {file_video}")
+    log_message(log_callback, f"Extracting images from frames {start_frame} to {end_frame} of {num_images}, stride {stride}"
+        + (", keyframes only" if keyframes_only else "") + (f", scene threshold {scene_threshold}" if scene_threshold is not None else ""))
+
+    dict_params = {"file_video" : file_video, "dir_images" : dir_images, "img_prefix" : img_prefix, "img_format" : img_format,
+        "img_id_start" : img_id_start, "num_write_workers" : num_write_workers, "max_queue_size" : max_queue_size,
+        "png_compression" : png_compression, "jpeg_quality" : jpeg_quality, "reader_backend" : reader_backend,
+        "num_decode_threads" : num_decode_threads, "start_sec" : start_sec, "end_sec" : end_sec, "stride" : stride,
+        "keyframes_only" : keyframes_only, "scene_threshold" : scene_threshold, "scene_width" : scene_width}
+    video_stat = os.stat(file_video)
+    job_checkpoint, is_resumed = start_job_checkpoint("video_to_images_opencv", dict_params,
+        ["num_write_workers", "max_queue_size", "reader_backend", "num_decode_threads"],
+        [video_stat.st_size, video_stat.st_mtime_ns], job_id=job_id, resume=resume, log_callback=log_callback)
+    resume_frame = job_checkpoint.get("resume_frame", start_frame) if is_resumed else start_frame
+    if resume_frame > start_frame:
+        log_message(log_callback, f"Resuming from frame {resume_frame}")
+
+    dict_pending = {}
+    lock_pending = threading.Lock()
+
+    def on_image_written(file_image):
+        with lock_pending:
+            dict_pending.pop(file_image, None)
+        return
+
+    def get_resume_frame(last_frame):
+        """
+        Returns the first frame whose image may not be written, all selected frames before it are written
+        """
+        with lock_pending:
+            return min(dict_pending.values(), default=last_frame + 1)
+
+    pipeline_stats, progress = get_pipeline_progress(progress_callback, num_candidates,
+        pipeline_stats=pipeline_stats, stats_callback=stats_callback)
+    image_writer_pool = ImageWriterPool(num_workers=num_write_workers, max_queue_size=max_queue_size,
+        png_compression=png_compression, jpeg_quality=jpeg_quality, pipeline_stats=pipeline_stats,
+        on_written=on_image_written)
+    last_frame = resume_frame - 1
+    num_skipped = 0
+    time_checkpoint = time.perf_counter()
+    try:
+        with image_writer_pool:
+            for i, image_frame, num_done in iter_selected_frames(video_reader, file_video, start_frame, end_frame,
+                stride=stride, keyframes_only=keyframes_only, scene_threshold=scene_threshold,
+                scene_width=scene_width, resume_frame=resume_frame, pipeline_stats=pipeline_stats):
+                file_name = os.path.join(dir_images, img_prefix + str(img_id_start+i) + img_format)
+                if is_resumed and is_image_written(file_name):
+                    num_skipped += 1
+                else:
+                    with lock_pending:
+                        dict_pending[file_name] = i
+                    image_writer_pool.write_image(file_name, image_frame)
+                    pipeline_stats.add_frames()
+                last_frame = i
+                progress.update(num_done)
+                if time.perf_counter() - time_checkpoint > checkpoint_interval:
+                    job_checkpoint.update(resume_frame=get_resume_frame(last_frame))
+                    time_checkpoint = time.perf_counter()
+    finally:
+        video_reader.close_video_reader()
+        job_checkpoint.update(resume_frame=get_resume_frame(last_frame))
+    progress.finish()
+
+    if len(image_writer_pool.errors) > 0:
+        raise RuntimeError("Failed to write images : " + "; ".join(
+            f"{file_name}, {err}" for file_name, err in image_writer_pool.errors))
+    job_checkpoint.finish()
+    if num_skipped > 0:
+        log_message(log_callback, f"Skipped {num_skipped} images written before")
+    log_message(log_callback, f"Wrote {image_writer_pool.num_written} images")
+    return image_writer_pool.num_written
+
+def title_card_ffmpeg(title_img, file_out, fps=30, num_sec=3, video_encoder="libx264", encoder_settings=None, log_callback=None):
+    """
+    Saves the title card as an image file, or as a still image video segment of num_sec
+    when file_out has a video file extension
+    """
+    dir_out = os.path.dirname(file_out)
+    if not os.path.isdir(dir_out):
+        _ = create_directory(dir_out)
+
+    if os.path.splitext(file_out)[1].lower() in (".png", ".jpg", ".jpeg"):
+        if not cv2.imwrite(file_out, title_img):
+            raise RuntimeError(f"Failed to write image : {file_out}")
+        return
+
+    with atomic_output_file(file_out) as file_out_partial:
+        FFMPEGStillImageSegmentWriter(fps=fps, width=title_img.shape[1], height=title_img.shape[0],
+            file_video=file_out_partial, video_encoder=video_encoder, encoder_settings=encoder_settings).write_still_image(title_img, int(round(num_sec * fps)))
+    return
+
+dict_resumable_jobs = {
+    "streaming_images_to_video_ffmpeg" : streaming_images_to_video_ffmpeg,
+    "video_to_images_opencv" : video_to_images_opencv,
+}
+
+def resume_job(job_id, log_callback=None, progress_callback=None, pipeline_stats=None, stats_callback=None):
+    """
+    Resumes the unfinished job job_id with the params saved in its checkpoint, see list_job_checkpoints,
+    and returns the output of the job
+    """
+    job_checkpoint = JobCheckpoint(job_id)
+    if not job_checkpoint.exists():
+        raise FileNotFoundError(f"Not found, checkpoint of job : {job_id}")
+    job_type = job_checkpoint.load().state["job_type"]
+    if job_type not in dict_resumable_jobs:
+        raise ValueError(f"Job {job_id} has unknown type : {job_type}, valid types : {list(dict_resumable_jobs.keys())}")
+    return dict_resumable_jobs[job_type](**job_checkpoint.get_params(), job_id=job_id, resume=True,
+        log_callback=log_callback, progress_callback=progress_callback, pipeline_stats=pipeline_stats, stats_callback=stats_callback)
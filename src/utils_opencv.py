@@ -1,37 +1,208 @@
 import os
 import sys
+import time
 import cv2
 import numpy as np
+import queue
+import functools
+import threading
+from collections import deque
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 class VideoReader:
-    def __init__(self, file_video):
+    def __init__(self, file_video, max_forward_skip=64):
         """
         Parameters
         ----------
         file_video (str) : full path of valid video file
+        max_forward_skip (int) : max number of frames skipped by decoding forward instead of seeking
         """
         self.num_images = None
         self.video_reader = None
         self.file_video = file_video
+        self.max_forward_skip = max_forward_skip
+        self.position = 0
 
     def init_video_reader(self):
         if self.video_reader is None:
             self.video_reader = cv2.VideoCapture(self.file_video)
+            if not self.video_reader.isOpened():
+                self.video_reader = None
+                raise IOError(f"Failed to open the video : {self.file_video}")
             self.num_images = int(self.video_reader.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.position = 0
+        return
+
+    def close_video_reader(self):
+        if self.video_reader is not None:
+            self.video_reader.release()
+            self.video_reader = None
         return
 
     def get_num_images_in_video(self):
         return self.num_images
 
+    def get_fps(self):
+        return self.video_reader.get(cv2.CAP_PROP_FPS)
+
     def get_next_image(self):
         ret_val, img = self.video_reader.read()
+        if ret_val:
+            self.position += 1
         return ret_val, img
 
+    def skip_next_image(self):
+        ret_val = self.video_reader.grab()
+        if ret_val:
+            self.position += 1
+        return ret_val
+
+    def seek(self, n):
+        """
+        Moves the reader to frame n, frames a short distance ahead of the current
+        position are grabbed without being retrieved instead of issuing a seek
+        """
+        if n == self.position:
+            return True
+        if self.position < n <= self.position + self.max_forward_skip:
+            while self.position < n:
+                if not self.skip_next_image():
+                    return False
+            return True
+        ret_val = self.video_reader.set(cv2.CAP_PROP_POS_FRAMES, n)
+        self.position = int(self.video_reader.get(cv2.CAP_PROP_POS_FRAMES))
+        return ret_val
+
     def get_nth_image(self, n):
-        self.video_reader.set(cv2.CAP_PROP_POS_FRAMES, n)
+        if not self.seek(n):
+            return False, None
         return self.get_next_image()
 
+    def iter_images(self, start=0, end=None, stride=1):
+        """
+        Yields (n, img) for every stride-th frame in [start, end) decoded in order without seeking per frame,
+        the frames in between are grabbed without being retrieved
+
+        Parameters
+        ----------
+        start (int) : id of the first frame
+        end (int) : id after the last frame, None to read until the end of the video
+        stride (int) : step between the yielded frames
+        """
+        if not self.seek(start):
+            return
+        while end is None or self.position < end:
+            n = self.position
+            if (n - start) % stride != 0:
+                if not self.skip_next_image():
+                    break
+                continue
+            ret_val, img = self.get_next_image()
+            if not ret_val:
+                break
+            yield n, img
+        return
+
+    def iter_keyframes(self, list_keyframe_ids):
+        """
+        Yields (n, img) for the keyframes in list_keyframe_ids, seeking to keyframes does not decode other frames
+        """
+        for n in list_keyframe_ids:
+            ret_val, img = self.get_nth_image(n)
+            if not ret_val:
+                break
+            yield n, img
+        return
+
+class VideoFramePrefetcher:
+    def __init__(self, video_reader, start=0, end=None, max_queue_size=16, pipeline_stats=None):
+        """
+        Decodes the frames of an initialized video reader in a background thread into a bounded queue,
+        so decoding overlaps with the processing of the frames
+
+        Parameters
+        ----------
+        video_reader (VideoReader) : initialized video reader
+        start (int) : id of the first frame
+        end (int) : id after the last frame, None to read until the end of the video
+        max_queue_size (int) : max number of decoded frames waiting to be processed
+        pipeline_stats (PipelineStats) : optional stats recording the "decode" stage and "decode" queue depth
+        """
+        self.video_reader = video_reader
+        self.start_frame = start
+        self.end_frame = end
+        self.frame_queue = queue.Queue(maxsize=max(1, max_queue_size))
+        self.pipeline_stats = pipeline_stats
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.frame_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def decode_loop(self):
+        try:
+            iter_images = self.video_reader.iter_images(self.start_frame, self.end_frame)
+            while not self.stop_event.is_set():
+                time_start = time.perf_counter()
+                n, img = next(iter_images, (None, None))
+                if self.pipeline_stats is not None:
+                    self.pipeline_stats.add_stage_time("decode", time.perf_counter() - time_start)
+                if n is None or not self.put((n, img, None)):
+                    break
+        except Exception as err:
+            self.put((None, None, err))
+            return
+        self.put((None, None, None))
+        return
+
+    def start(self):
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.decode_loop, daemon=True)
+            self.thread.start()
+        return
+
+    def close(self):
+        """
+        Stops the decoding thread, the video reader can be closed afterwards
+        """
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        return
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __iter__(self):
+        """
+        Yields (n, img) in decoding order, errors of the decoding thread are raised here
+        """
+        self.start()
+        while True:
+            if self.pipeline_stats is not None:
+                self.pipeline_stats.set_queue_depth("decode", self.frame_queue.qsize())
+            n, img, err = self.frame_queue.get()
+            if err is not None:
+                raise err
+            if n is None:
+                break
+            yield n, img
+        return
+
 class VideoWriter:
     def __init__(self, fps, width, height, file_video, video_encoder):
         """
@@ -69,10 +240,343 @@ class VideoWriter:
     def write_image_to_video(self, image_array):
         self.video_writer.write(image_array)
 
+class ImagePrefetcher:
+    def __init__(self, dir_images, list_images, num_workers=4, prefetch_depth=16, imread_flag=cv2.IMREAD_COLOR, pipeline_stats=None):
+        """
+        Parameters
+        ----------
+        dir_images (str) : full path of the directory with images
+        list_images (list) : ordered list of image file names in dir_images
+        num_workers (int) : number of threads used for decoding images
+        prefetch_depth (int) : max number of images decoded ahead of the consumer
+        imread_flag (int) : flag passed to cv2.imread
+        pipeline_stats (PipelineStats) : optional stats recording the "decode" stage and "prefetch" queue depth
+        """
+        self.dir_images = dir_images
+        self.list_images = list_images
+        self.num_workers = max(1, num_workers)
+        self.prefetch_depth = max(1, prefetch_depth)
+        self.imread_flag = imread_flag
+        self.pipeline_stats = pipeline_stats
+
+    def read_image(self, file_image):
+        if self.pipeline_stats is None:
+            return cv2.imread(os.path.join(self.dir_images, file_image), self.imread_flag)
+        with self.pipeline_stats.time_stage("decode"):
+            img = cv2.imread(os.path.join(self.dir_images, file_image), self.imread_flag)
+        return img
+
+    def __len__(self):
+        return len(self.list_images)
+
+    def __iter__(self):
+        """
+        Yields (file_image, img) tuples in the order of list_images, img is None if decoding failed
+        """
+        num_images = len(self.list_images)
+        pending = deque()
+        next_id = 0
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            try:
+                while next_id < num_images and len(pending) < self.prefetch_depth:
+                    pending.append((self.list_images[next_id], executor.submit(self.read_image, self.list_images[next_id])))
+                    next_id += 1
+                while pending:
+                    file_image, future = pending.popleft()
+                    if next_id < num_images:
+                        pending.append((self.list_images[next_id], executor.submit(self.read_image, self.list_images[next_id])))
+                        next_id += 1
+                    if self.pipeline_stats is None:
+                        img = future.result()
+                    else:
+                        self.pipeline_stats.set_queue_depth("prefetch", sum(f.done() for _, f in pending))
+                        with self.pipeline_stats.time_stage("wait_decode"):
+                            img = future.result()
+                    yield file_image, img
+            finally:
+                for _, future in pending:
+                    future.cancel()
+        return
+
+class ImageWriterPool:
+    def __init__(self, num_workers=4, max_queue_size=32, png_compression=3, jpeg_quality=95, pipeline_stats=None, on_written=None):
+        """
+        Images are encoded to a temporary file moved over the image file, so an existing image file is always complete
+
+        Parameters
+        ----------
+        num_workers (int) : number of threads used for encoding and writing images
+        max_queue_size (int) : max number of images waiting to be written
+        png_compression (int) : png compression level (0-9)
+        jpeg_quality (int) : jpeg quality (0-100)
+        pipeline_stats (PipelineStats) : optional stats recording the "encode_write" stage and "write" queue depth
+        on_written (callable) : called from the worker threads with the file name of every written image
+        """
+        self.num_workers = max(1, num_workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self.png_compression = png_compression
+        self.jpeg_quality = jpeg_quality
+        self.image_queue = None
+        self.workers = []
+        self.errors = []
+        self.num_written = 0
+        self.lock = threading.Lock()
+        self.pipeline_stats = pipeline_stats
+        self.on_written = on_written
+
+    def get_imwrite_params(self, file_image):
+        img_format = os.path.splitext(file_image)[1].lower()
+        if img_format == ".png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        if img_format in (".jpg", ".jpeg"):
+            return [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        return []
+
+    def write_image_file(self, file_image, img):
+        ret_val, img_encoded = cv2.imencode(os.path.splitext(file_image)[1], img, self.get_imwrite_params(file_image))
+        if not ret_val:
+            raise IOError("cv2.imencode returned False")
+        file_tmp = f"{file_image}.tmp"
+        try:
+            with open(file_tmp, "wb") as file_des:
+                file_des.write(img_encoded.tobytes())
+            os.replace(file_tmp, file_image)
+        except OSError:
+            if os.path.isfile(file_tmp):
+                os.unlink(file_tmp)
+            raise
+        return
+
+    def start(self):
+        if self.image_queue is None:
+            self.image_queue = queue.Queue(maxsize=self.max_queue_size)
+            self.workers = [threading.Thread(target=self.worker_loop, daemon=True) for _ in range(self.num_workers)]
+            for worker in self.workers:
+                worker.start()
+        return
+
+    def worker_loop(self):
+        while True:
+            item = self.image_queue.get()
+            if item is None:
+                self.image_queue.task_done()
+                break
+            file_image, img = item
+            try:
+                time_start = time.perf_counter()
+                self.write_image_file(file_image, img)
+                if self.pipeline_stats is not None:
+                    self.pipeline_stats.add_stage_time("encode_write", time.perf_counter() - time_start)
+                with self.lock:
+                    self.num_written += 1
+                if self.on_written is not None:
+                    self.on_written(file_image)
+            except Exception as err:
+                with self.lock:
+                    self.errors.append((file_image, str(err)))
+            finally:
+                self.image_queue.task_done()
+        return
+
+    def write_image(self, file_image, img):
+        """
+        Queues the image for writing, blocks while the queue is full
+        so at most max_queue_size + num_workers images are held in memory
+        """
+        if self.pipeline_stats is None:
+            self.image_queue.put((file_image, img))
+            return
+        with self.pipeline_stats.time_stage("wait_write_queue"):
+            self.image_queue.put((file_image, img))
+        self.pipeline_stats.set_queue_depth("write", self.image_queue.qsize())
+        return
+
+    def close(self):
+        """
+        Waits for all queued images to be written and returns the list of (file_image, error) tuples
+        """
+        if self.image_queue is not None:
+            for _ in self.workers:
+                self.image_queue.put(None)
+            for worker in self.workers:
+                worker.join()
+            self.image_queue = None
+            self.workers = []
+        return self.errors
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+class FrameNormalizer:
+    list_fit_modes = ["resize", "letterbox", "crop"]
+    dict_interpolations = {"nearest" : cv2.INTER_NEAREST, "linear" : cv2.INTER_LINEAR, "area" : cv2.INTER_AREA,
+        "cubic" : cv2.INTER_CUBIC, "lanczos" : cv2.INTER_LANCZOS4}
+
+    def __init__(self, width, height, fit_mode="letterbox", interpolation="area", color_background=(0, 0, 0), pipeline_stats=None):
+        """
+        Converts frames of any size to width x height, frames already of the target size are returned as is,
+        other frames are resized into preallocated buffers which are reused by the next call, the letterbox
+        padding is refilled on every call so that later in place operations do not leak between frames
+
+        Parameters
+        ----------
+        width (int) : target width
+        height (int) : target height
+        fit_mode (str) : "resize" stretches to the target size, "letterbox" keeps the aspect ratio and pads
+            with color_background, "crop" keeps the aspect ratio and crops the center
+        interpolation (str) : one of the dict_interpolations keys
+        color_background (tuple) : bgr color of the letterbox padding
+        pipeline_stats (PipelineStats) : optional stats recording the "normalize" stage
+        """
+        if fit_mode not in self.list_fit_modes:
+            raise ValueError(f"Unknown fit mode : {fit_mode}, valid fit modes : {self.list_fit_modes}")
+        if interpolation not in self.dict_interpolations:
+            raise ValueError(f"Unknown interpolation : {interpolation}, valid interpolations : {list(self.dict_interpolations.keys())}")
+        self.width = width
+        self.height = height
+        self.fit_mode = fit_mode
+        self.interpolation = self.dict_interpolations[interpolation]
+        self.color_background = color_background
+        self.pipeline_stats = pipeline_stats
+        self.frame_buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self.scaled_buffer = None
+        self.padding_views = []
+        self.layout = None
+        self.num_normalized = 0
+
+    def get_layout(self, img_height, img_width):
+        """
+        Returns (src_y, src_x, src_height, src_width, dst_y, dst_x, dst_height, dst_width), the source region
+        resized into the destination region of the frame
+        """
+        if self.fit_mode == "resize":
+            return 0, 0, img_height, img_width, 0, 0, self.height, self.width
+        if self.fit_mode == "letterbox":
+            scale = min(self.width / img_width, self.height / img_height)
+            dst_width = max(1, min(self.width, int(round(img_width * scale))))
+            dst_height = max(1, min(self.height, int(round(img_height * scale))))
+            return 0, 0, img_height, img_width, (self.height - dst_height) // 2, (self.width - dst_width) // 2, dst_height, dst_width
+        scale = max(self.width / img_width, self.height / img_height)
+        src_width = max(1, min(img_width, int(round(self.width / scale))))
+        src_height = max(1, min(img_height, int(round(self.height / scale))))
+        return (img_height - src_height) // 2, (img_width - src_width) // 2, src_height, src_width, 0, 0, self.height, self.width
+
+    def set_layout(self, img_shape):
+        self.layout = (img_shape, self.get_layout(img_shape[0], img_shape[1]))
+        _, _, _, _, dst_y, dst_x, dst_height, dst_width = self.layout[1]
+        if self.fit_mode == "letterbox":
+            self.scaled_buffer = np.empty((dst_height, dst_width, 3), dtype=np.uint8)
+            self.padding_views = [self.frame_buffer[:dst_y], self.frame_buffer[dst_y+dst_height:],
+                self.frame_buffer[dst_y:dst_y+dst_height, :dst_x], self.frame_buffer[dst_y:dst_y+dst_height, dst_x+dst_width:]]
+        return
+
+    def normalize(self, img):
+        if img.shape[:2] == (self.height, self.width) and img.ndim == 3 and img.shape[2] == 3:
+            return img
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        elif img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        if self.layout is None or self.layout[0] != img.shape:
+            self.set_layout(img.shape)
+        src_y, src_x, src_height, src_width, dst_y, dst_x, dst_height, dst_width = self.layout[1]
+        img_src = img[src_y:src_y+src_height, src_x:src_x+src_width]
+        if self.fit_mode == "letterbox":
+            cv2.resize(img_src, (dst_width, dst_height), dst=self.scaled_buffer, interpolation=self.interpolation)
+            self.frame_buffer[dst_y:dst_y+dst_height, dst_x:dst_x+dst_width] = self.scaled_buffer
+            for padding_view in self.padding_views:
+                padding_view[:] = self.color_background
+        else:
+            cv2.resize(img_src, (self.width, self.height), dst=self.frame_buffer, interpolation=self.interpolation)
+        self.num_normalized += 1
+        return self.frame_buffer
+
+    def __call__(self, img):
+        """
+        Returns the frame of the target size, the returned array may be the internal buffer overwritten by the next call
+        """
+        if self.pipeline_stats is None:
+            return self.normalize(img)
+        with self.pipeline_stats.time_stage("normalize"):
+            img = self.normalize(img)
+        return img
+
+class SceneChangeDetector:
+    def __init__(self, threshold=0.1, width=64):
+        """
+        Detects scene changes by the mean absolute difference of downscaled grayscale frames
+
+        Parameters
+        ----------
+        threshold (float) : min mean absolute difference in [0, 1] to the last compared frame
+        width (int) : width of the downscaled frames, the height keeps the aspect ratio
+        """
+        self.threshold = threshold
+        self.width = width
+        self.small_buffers = None
+        self.has_previous = False
+        self.last_score = 0.0
+
+    def get_small_frame(self, img):
+        if self.small_buffers is None:
+            height = max(1, int(round(img.shape[0] * self.width / img.shape[1])))
+            self.small_buffers = [np.empty((height, self.width), dtype=np.uint8) for _ in range(2)]
+        self.small_buffers.reverse()
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        return cv2.resize(gray, (self.width, self.small_buffers[0].shape[0]), dst=self.small_buffers[0], interpolation=cv2.INTER_AREA)
+
+    def is_scene_change(self, img):
+        """
+        Returns True for the first frame and for frames differing from the previous one by more than threshold
+        """
+        small_frame = self.get_small_frame(img)
+        if not self.has_previous:
+            self.has_previous = True
+            self.last_score = 1.0
+            return True
+        self.last_score = float(np.mean(cv2.absdiff(small_frame, self.small_buffers[1]))) / 255
+        return self.last_score > self.threshold
+
 def write_text_to_image(img, text, text_position, font, font_scale, color_rgb):
     img = cv2.putText(img, text, text_position, fontFace=font, fontScale=font_scale, color=color_rgb)
     return img
 
+class TextOverlay:
+    def __init__(self, text, text_position, font=cv2.FONT_HERSHEY_SIMPLEX, font_scale=1, color_text="white", thickness=1):
+        """
+        Frame operation drawing the text on every frame
+
+        Parameters
+        ----------
+        text (str) : text to be drawn
+        text_position (tuple) : (x, y) of the bottom left corner of the text
+        font (int) : opencv font
+        font_scale (float) : font scale
+        color_text (str) : "white" or "black"
+        thickness (int) : line thickness of the text
+        """
+        self.text = text
+        self.text_position = tuple(text_position)
+        self.font = font
+        self.font_scale = font_scale
+        self.color_rgb = (255, 255, 255) if color_text == "white" else (0, 0, 0)
+        self.thickness = thickness
+
+    def __call__(self, img):
+        """
+        Draws the text in place, read only frames are copied first
+        """
+        if not img.flags.writeable:
+            img = img.copy()
+        cv2.putText(img, self.text, self.text_position, fontFace=self.font, fontScale=self.font_scale,
+            color=self.color_rgb, thickness=self.thickness)
+        return img
+
 def get_font_list():
     list_fonts = [
         cv2.FONT_HERSHEY_PLAIN, cv2.FONT_HERSHEY_SIMPLEX,
@@ -98,6 +602,7 @@ def get_font_dict():
 
     return dict_fonts
 
+@functools.lru_cache(maxsize=1)
 def get_font_preview_image():
     list_fonts, list_font_names = get_font_list()
     num_fonts = len(list_fonts)
@@ -108,6 +613,7 @@ def get_font_preview_image():
     for i in range(num_fonts):
         font_preview_img = write_text_to_image(font_preview_img, list_font_names[i],
             (pos_x, pos_y * (i+1)), list_fonts[i], 1, (255, 255, 255))
+    font_preview_img.flags.writeable = False
     return font_preview_img
 
 def get_preview_image_with_text(font, text, image_height, image_width, text_position, color_background="black", color_text="white", font_scale=2):
@@ -126,3 +632,39 @@ def get_preview_image_with_text(font, text, image_height, image_width, text_posi
 
     preview_image = write_text_to_image(preview_image, text, text_position, font, font_scale, color_rgb)
     return preview_image
+
+@functools.lru_cache(maxsize=16)
+def get_cached_preview_image_with_text(font, text, image_height, image_width, text_position, color_background="black", color_text="white", font_scale=2):
+    """
+    Memoized get_preview_image_with_text, the returned image is shared between callers and read only,
+    text_position must be a tuple
+    """
+    preview_image = get_preview_image_with_text(font, text, image_height, image_width, text_position,
+        color_background=color_background, color_text=color_text, font_scale=font_scale)
+    preview_image.flags.writeable = False
+    return preview_image
+
+def iter_fade_frames(card_img, num_frames, fade_in=True, background_img=None, chunk_size=4):
+    """
+    Yields arrays of up to chunk_size frames (chunk, height, width, 3) blending the card with the
+    background, alpha blending is vectorized over each chunk with 7 bit fixed point weights in int16
+
+    Parameters
+    ----------
+    card_img (np.ndarray) : title card image
+    num_frames (int) : number of frames of the fade
+    fade_in (bool) : fade from the background to the card if True, from the card to the background otherwise
+    background_img (np.ndarray) : background image, black by default
+    chunk_size (int) : max number of frames blended at once
+    """
+    card = card_img.astype(np.int16)
+    background = np.zeros_like(card) if background_img is None else background_img.astype(np.int16)
+    difference = card - background
+    alphas = np.round(128 * np.arange(1, num_frames+1) / (num_frames+1)).astype(np.int16)
+    if not fade_in:
+        alphas = alphas[::-1]
+    for i in range(0, num_frames, chunk_size):
+        alphas_chunk = alphas[i:i+chunk_size].reshape(-1, 1, 1, 1)
+        frames = background + ((difference * alphas_chunk) >> 7)
+        yield frames.astype(np.uint8)
+    return
@@ -0,0 +1,204 @@
+import os
+import sys
+import re
+import uuid
+import errno
+import hashlib
+import mimetypes
+import threading
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ffmpeg_runner import FFMPEGError, run_ffmpeg
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    chunk_size = 1024 * 1024
+    range_pattern = re.compile(r"bytes=(\d*)-(\d*)")
+
+    def log_message(self, format, *args):
+        return
+
+    def get_file_path(self):
+        token = self.path.lstrip("/").split("/")[0]
+        return self.server.dict_files.get(token)
+
+    def send_file_headers(self):
+        """
+        Sends the response headers and returns (file_path, start, length), file_path is None on errors
+        """
+        file_path = self.get_file_path()
+        if file_path is None or not os.path.isfile(file_path):
+            self.send_error(404, "File not found")
+            return None, 0, 0
+
+        file_size = os.path.getsize(file_path)
+        start, end = 0, file_size - 1
+        range_match = self.range_pattern.fullmatch(self.headers.get("Range", "").strip())
+        if range_match is not None and (range_match.group(1) or range_match.group(2)):
+            if range_match.group(1):
+                start = int(range_match.group(1))
+                end = int(range_match.group(2)) if range_match.group(2) else file_size - 1
+            else:
+                start = max(0, file_size - int(range_match.group(2)))
+            end = min(end, file_size - 1)
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{file_size}")
+                self.end_headers()
+                return None, 0, 0
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Type", mimetypes.guess_type(file_path)[0] or "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", f"{end - start + 1}")
+        self.end_headers()
+        return file_path, start, end - start + 1
+
+    def do_HEAD(self):
+        self.send_file_headers()
+        return
+
+    def do_GET(self):
+        file_path, start, length = self.send_file_headers()
+        if file_path is None:
+            return
+        try:
+            with open(file_path, "rb") as file_des:
+                file_des.seek(start)
+                while length > 0:
+                    chunk = file_des.read(min(self.chunk_size, length))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    length -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        return
+
+class VideoFileServer:
+    def __init__(self, host="127.0.0.1", port=8765, url_base=None):
+        """
+        Local http server serving registered video files in chunks with support for range requests,
+        so the browser streams and seeks in the file without it being loaded into memory
+
+        Parameters
+        ----------
+        host (str) : host to bind the server, 0.0.0.0 when the browsers are on other machines
+        port (int) : port to bind the server
+        url_base (str) : base url of the server as seen by the browser, defaults to http://host:port, which is only
+            reachable from the browser of a remote user if set to the address of this machine, see get_playback_url_base
+        """
+        self.host = host
+        self.port = port
+        self.url_base = (url_base or f"http://{host}:{port}").rstrip("/")
+        self.http_server = None
+        self.thread = None
+        self.dict_tokens = {}
+
+    def start(self):
+        if self.http_server is None:
+            try:
+                self.http_server = ThreadingHTTPServer((self.host, self.port), RangeRequestHandler)
+            except OSError as err:
+                if err.errno == errno.EADDRINUSE:
+                    raise RuntimeError(f"Playback server port {self.port} on {self.host} is already in use, choose another port") from err
+                raise
+            self.http_server.daemon_threads = True
+            self.http_server.dict_files = {}
+            self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+            self.thread.start()
+        return
+
+    def stop(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+        return
+
+    def register_file(self, file_path):
+        """
+        Returns the url of the file, only registered files are served, each under a random token
+        """
+        self.start()
+        file_path = os.path.abspath(file_path)
+        if file_path not in self.dict_tokens:
+            token = uuid.uuid4().hex
+            self.dict_tokens[file_path] = token
+            self.http_server.dict_files[token] = file_path
+        return f"{self.url_base}/{self.dict_tokens[file_path]}/{os.path.basename(file_path)}"
+
+def get_browser_host_name(browser_host):
+    """
+    Returns the host name of the Host header of the app request e.g. "server.example.com:8501"
+    """
+    return urlsplit(f"//{browser_host}").hostname or "localhost"
+
+def get_playback_url_base(browser_host, port):
+    """
+    Returns the base url of the playback server on the host name the browser used to reach the app
+    """
+    host_name = get_browser_host_name(browser_host)
+    if ":" in host_name:
+        host_name = f"[{host_name}]"
+    return f"http://{host_name}:{port}"
+
+def is_local_host(browser_host):
+    return get_browser_host_name(browser_host) in ("localhost", "127.0.0.1", "::1")
+
+def get_file_cache_key(file_path, sample_size=1024*1024):
+    """
+    Returns a hash of the path, size, mtime and the first and last sample_size bytes of the file,
+    so that large files are identified without being read fully
+    """
+    file_stat = os.stat(file_path)
+    hasher = hashlib.sha1()
+    hasher.update(f"{os.path.abspath(file_path)}|{file_stat.st_size}|{file_stat.st_mtime_ns}".encode())
+    with open(file_path, "rb") as file_des:
+        hasher.update(file_des.read(sample_size))
+        if file_stat.st_size > sample_size:
+            file_des.seek(max(sample_size, file_stat.st_size - sample_size))
+            hasher.update(file_des.read(sample_size))
+    return hasher.hexdigest()
+
+def get_default_proxy_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "video_editor_web", "proxies")
+
+def get_proxy_video(file_video, dir_cache=None, height=480, crf=30, preset="veryfast"):
+    """
+    Returns the path of a low bitrate proxy of the video for playback, the proxy is
+    transcoded once and cached on disk by the file hash and mtime
+
+    Parameters
+    ----------
+    file_video (str) : full path of the source video file
+    dir_cache (str) : directory of the cached proxies
+    height (int) : height of the proxy video
+    crf (int) : constant rate factor of the proxy video
+    preset (str) : x264 preset used for the transcode
+    """
+    dir_cache = dir_cache or get_default_proxy_dir()
+    os.makedirs(dir_cache, exist_ok=True)
+    file_proxy = os.path.join(dir_cache, f"{get_file_cache_key(file_video)}_{height}p_crf{crf}.mp4")
+    if os.path.isfile(file_proxy):
+        return file_proxy
+
+    file_proxy_tmp = file_proxy + f".{uuid.uuid4().hex}.tmp.mp4"
+    cmd_ffmpeg = ["ffmpeg", "-y", "-i", file_video,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", f"scale=-2:'min({height},ih)'",
+        "-c:v", "libx264", "-preset", preset, "-crf", f"{crf}", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "96k",
+        "-movflags", "+faststart",
+        file_proxy_tmp]
+    try:
+        run_ffmpeg(cmd_ffmpeg)
+    except FFMPEGError:
+        if os.path.isfile(file_proxy_tmp):
+            os.unlink(file_proxy_tmp)
+        raise
+    os.replace(file_proxy_tmp, file_proxy)
+    return file_proxy
@@ -1,16 +1,56 @@
 import os
 import sys
 import cv2
+import json
+import math
+import shutil
+import tempfile
+import threading
 import numpy as np
-from dataclasses import dataclass
-from subprocess import Popen, PIPE, DEVNULL
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import PIPE, run
+
+from file_utils import get_list_images
+from encoder_settings import EncoderSettings
+from ffmpeg_runner import FFMPEGProcessRunner, FFMPEGProgress, run_ffmpeg
 
 class FFMPEGSavedImageToVideoWriter:
-    def __init__(self, dir_images, file_video, fps=30, crf=23, img_format=".png", video_encoder="libx264", video_pixel_format="yuv420p"):
+    def __init__(self, dir_images, file_video, fps=30, crf=23, img_format=".png", video_encoder="libx264", video_pixel_format="yuv420p", encoder_settings=None,
+        list_images=None, hold_counts=None):
+        """
+        Encodes saved images read through an ffconcat list generated from our own image index,
+        so ffmpeg encodes exactly the listed images in the listed order, every entry is one frame
+
+        Parameters
+        ----------
+        dir_images (str) : full path of the directory with images
+        file_video (str) : full path of video file
+        fps (int) : fps of video
+        crf (int) : constant rate factor, ignored if encoder_settings is given
+        img_format (str) : image file format
+        video_encoder (str) : video encoder to be used, ignored if encoder_settings is given
+        video_pixel_format (str) : pixel format of the video, ignored if encoder_settings is given
+        encoder_settings (EncoderSettings) : encoder options, two pass encoding is supported
+        list_images (list) : ordered image file names in dir_images, defaults to all the naturally sorted images of dir_images
+        hold_counts (list) : number of frames each image is held, defaults to 1 frame for every image
+        """
+        if encoder_settings is None:
+            encoder_settings = EncoderSettings(video_encoder=video_encoder, crf=crf, pixel_format=video_pixel_format,
+                profile="high" if video_encoder == "libx264" and crf != 0 else None)
+        encoder_settings.validate()
+        if list_images is None:
+            list_images = get_list_images(dir_images, img_format)
+        if hold_counts is None:
+            hold_counts = [1] * len(list_images)
+        if len(hold_counts) != len(list_images):
+            raise ValueError(f"Num hold counts : {len(hold_counts)} mismatch with num images : {len(list_images)}")
+        self.list_images = list_images
+        self.hold_counts = hold_counts
         self.cmd_ffmpeg = None
-        self.ffmpeg_params = self.FFMPEGParams(fps=fps, crf=crf, dir_images=dir_images,
-            file_video=file_video, img_format=img_format, video_encoder=video_encoder,
-            video_pixel_format=video_pixel_format)
+        self.ffmpeg_params = self.FFMPEGParams(fps=fps, crf=encoder_settings.crf, dir_images=dir_images,
+            file_video=file_video, img_format=img_format, video_encoder=encoder_settings.video_encoder,
+            video_pixel_format=encoder_settings.pixel_format, encoder_settings=encoder_settings)
 
     @dataclass
     class FFMPEGParams:
@@ -21,26 +61,254 @@ class FFMPEGSavedImageToVideoWriter:
         img_format : str
         video_encoder : str
         video_pixel_format : str
+        encoder_settings : EncoderSettings
+
+    def get_num_frames(self):
+        """
+        Returns the number of frames of the constant frame rate video
+        """
+        return sum(self.hold_counts)
+
+    def get_ffmpeg_command(self, file_list, pass_num=None, file_passlog=None):
+        cmd_ffmpeg = ["ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", file_list,
+            "-vf", get_frame_index_timestamps_filter(self.ffmpeg_params.fps),
+            "-frames:v", f"{self.get_num_frames()}",
+            "-r", f"{self.ffmpeg_params.fps}",
+            *self.ffmpeg_params.encoder_settings.get_ffmpeg_args(pass_num=pass_num, file_passlog=file_passlog)]
+        if pass_num == 1:
+            cmd_ffmpeg += ["-an", "-f", "null", os.devnull]
+        else:
+            cmd_ffmpeg += [self.ffmpeg_params.file_video]
+        return cmd_ffmpeg
+
+    def generate_video_from_saved_images(self, progress_callback=None, timeout=None):
+        """
+        Runs ffmpeg, or both passes of two pass encoding, and returns the FFMPEGRunResult of the last pass,
+        raises FFMPEGError if ffmpeg fails or runs longer than timeout sec.
+        """
+        if len(self.list_images) == 0:
+            raise ValueError(f"No images to encode in {self.ffmpeg_params.dir_images}")
+        dir_tmp = tempfile.mkdtemp(prefix="saved_images_", dir=os.path.dirname(self.ffmpeg_params.file_video))
+        try:
+            file_list = os.path.join(dir_tmp, "image_list.txt")
+            write_ffconcat_image_list(file_list,
+                [os.path.join(os.path.abspath(self.ffmpeg_params.dir_images), file_image)
+                for file_image, hold_count in zip(self.list_images, self.hold_counts) for _ in range(hold_count)])
+            file_passlog = os.path.join(dir_tmp, "ffmpeg2pass")
+            list_passes = [1, 2] if self.ffmpeg_params.encoder_settings.two_pass else [None]
+            for pass_num in list_passes:
+                self.cmd_ffmpeg = self.get_ffmpeg_command(file_list, pass_num=pass_num, file_passlog=file_passlog)
+                run_result = run_ffmpeg(self.cmd_ffmpeg, progress_callback=progress_callback, timeout=timeout)
+        finally:
+            shutil.rmtree(dir_tmp, ignore_errors=True)
+        return run_result
+
+def get_ffconcat_entry(file_path):
+    file_path = file_path.replace("'", "'\\''")
+    return f"file '{file_path}'\n"
+
+def write_ffconcat_image_list(file_list, list_files_images):
+    """
+    Writes an ffconcat file listing one entry per frame, images held for several frames are repeated,
+    the timestamps are set by get_frame_index_timestamps_filter
+
+    Parameters
+    ----------
+    file_list (str) : full path of the ffconcat file to be created
+    list_files_images (list) : ordered list of full paths of the images, one per frame
+    """
+    with open(file_list, "w") as file_des:
+        file_des.write("ffconcat version 1.0\n")
+        for file_image in list_files_images:
+            file_des.write(get_ffconcat_entry(file_image))
+    return
+
+def get_frame_index_timestamps_filter(fps):
+    """
+    Returns the filter setting the timestamp of frame N to exactly N / fps, the concat demuxer gives every
+    image the 1/25 time base of image2, which the constant frame rate output would fit by dropping and repeating frames
+    """
+    return f"settb=1/{fps},setpts=N"
+
+class FFMPEGChunkedImageToVideoWriter:
+    def __init__(self, dir_images, list_images, file_video, fps=30, crf=23, video_encoder="libx264", video_pixel_format="yuv420p", num_chunks=4, gop_size=None, threads_per_chunk=None, encoder_settings=None):
+        """
+        Splits the image sequence into GOP aligned chunks encoded by parallel ffmpeg processes,
+        the chunks are concatenated with the concat demuxer without re-encoding
+
+        Parameters
+        ----------
+        dir_images (str) : full path of the directory with images
+        list_images (list) : ordered list of image file names in dir_images
+        file_video (str) : full path of video file
+        fps (int) : fps of video
+        crf (int) : constant rate factor
+        video_encoder (str) : video encoder to be used
+        video_pixel_format (str) : pixel format of the video
+        num_chunks (int) : number of chunks encoded in parallel
+        gop_size (int) : keyframe interval, chunk boundaries are multiples of it, defaults to 2 sec.
+        threads_per_chunk (int) : encoder threads for each ffmpeg process, defaults to the encoder_settings threads or cpu count / num_chunks
+        encoder_settings (EncoderSettings) : encoder options, crf, video_encoder and video_pixel_format are ignored if given
+        """
+        if encoder_settings is None:
+            encoder_settings = EncoderSettings(video_encoder=video_encoder, crf=crf, pixel_format=video_pixel_format)
+        threads_per_chunk = threads_per_chunk or encoder_settings.threads or max(1, (os.cpu_count() or 1) // max(1, num_chunks))
+        encoder_settings = replace(encoder_settings, threads=threads_per_chunk)
+        encoder_settings.validate()
+        self.list_images = list_images
+        self.ffmpeg_params = self.FFMPEGParams(fps=fps, crf=encoder_settings.crf, dir_images=dir_images,
+            file_video=file_video, video_encoder=encoder_settings.video_encoder, video_pixel_format=encoder_settings.pixel_format,
+            num_chunks=max(1, num_chunks), gop_size=gop_size or 2 * fps,
+            threads_per_chunk=threads_per_chunk, encoder_settings=encoder_settings)
+
+    @dataclass
+    class FFMPEGParams:
+        fps : int
+        crf : int
+        dir_images : str
+        file_video : str
+        video_encoder : str
+        video_pixel_format : str
+        num_chunks : int
+        gop_size : int
+        threads_per_chunk : int
+        encoder_settings : EncoderSettings
+
+    def get_chunks(self):
+        num_images = len(self.list_images)
+        gop_size = self.ffmpeg_params.gop_size
+        num_gops = math.ceil(num_images / gop_size)
+        chunk_size = math.ceil(num_gops / self.ffmpeg_params.num_chunks) * gop_size
+        return [self.list_images[i:i+chunk_size] for i in range(0, num_images, chunk_size)]
+
+    def get_keyframe_args(self):
+        gop_size = self.ffmpeg_params.gop_size
+        keyframe_args = ["-g", f"{gop_size}", "-keyint_min", f"{gop_size}"]
+        if self.ffmpeg_params.video_encoder == "libx264":
+            keyframe_args += ["-sc_threshold", "0"]
+        return keyframe_args
+
+    def get_ffmpeg_command(self, file_list, num_frames, file_chunk, pass_num=None, file_passlog=None):
+        gop_size = self.ffmpeg_params.gop_size
+        cmd_ffmpeg = ["ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", file_list,
+            "-vf", get_frame_index_timestamps_filter(self.ffmpeg_params.fps),
+            "-frames:v", f"{num_frames}",
+            "-r", f"{self.ffmpeg_params.fps}",
+            *self.ffmpeg_params.encoder_settings.get_ffmpeg_args(pass_num=pass_num, file_passlog=file_passlog,
+                extra_x265_params={"keyint" : gop_size, "min-keyint" : gop_size, "scenecut" : 0}),
+            *self.get_keyframe_args()]
+        if pass_num == 1:
+            cmd_ffmpeg += ["-an", "-f", "null", os.devnull]
+        else:
+            cmd_ffmpeg += [file_chunk]
+        return cmd_ffmpeg
+
+    def update_chunk_progress(self, chunk_id, chunk_progress, progress_callback):
+        """
+        Aggregates the progress of the chunks, frames and fps are summed over the running chunks
+        """
+        with self.progress_lock:
+            self.chunk_progress[chunk_id] = chunk_progress
+            progress = FFMPEGProgress(
+                frame=sum(chunk_progress.frame for chunk_progress in self.chunk_progress.values()),
+                fps=sum(chunk_progress.fps for chunk_progress in self.chunk_progress.values() if not chunk_progress.is_end),
+                speed=sum(chunk_progress.speed for chunk_progress in self.chunk_progress.values() if not chunk_progress.is_end),
+                total_size=sum(chunk_progress.total_size for chunk_progress in self.chunk_progress.values()))
+            progress_callback(progress)
+        return
 
-    def generate_video_from_saved_images(self):
-        self.cmd_ffmpeg = f"ffmpeg -framerate {self.ffmpeg_params.fps} \
-            -pattern_type glob -i '{self.ffmpeg_params.dir_images}/*{self.ffmpeg_params.img_format}' \
-            -c:v {self.ffmpeg_params.video_encoder} -profile:v high -crf {self.ffmpeg_params.crf} \
-            -pix_fmt {self.ffmpeg_params.video_pixel_format} {self.ffmpeg_params.file_video}"
-        print(f"{self.cmd_ffmpeg}")
+    def encode_chunk(self, dir_chunks, chunk_id, list_chunk_images, progress_callback=None, timeout=None):
+        file_list = os.path.join(dir_chunks, f"chunk_{chunk_id:04d}.txt")
+        file_chunk = os.path.join(dir_chunks, f"chunk_{chunk_id:04d}" + os.path.splitext(self.ffmpeg_params.file_video)[1])
+        file_passlog = os.path.join(dir_chunks, f"chunk_{chunk_id:04d}_passlog")
+        write_ffconcat_image_list(file_list,
+            [os.path.join(os.path.abspath(self.ffmpeg_params.dir_images), file_image) for file_image in list_chunk_images])
+        list_passes = [1, 2] if self.ffmpeg_params.encoder_settings.two_pass else [None]
+        chunk_progress_callback = None
+        if progress_callback is not None:
+            chunk_progress_callback = lambda chunk_progress: self.update_chunk_progress(chunk_id, chunk_progress, progress_callback)
+        for pass_num in list_passes:
+            run_ffmpeg(self.get_ffmpeg_command(file_list, len(list_chunk_images), file_chunk,
+                pass_num=pass_num, file_passlog=file_passlog),
+                progress_callback=chunk_progress_callback if pass_num != 1 else None, timeout=timeout)
+        return file_chunk
 
-        os.system(self.cmd_ffmpeg)
+    def generate_video_from_saved_images(self, progress_callback=None, timeout=None):
+        """
+        Encodes the chunks in parallel and concatenates them, progress_callback is called with
+        the FFMPEGProgress aggregated over the chunks, timeout applies to each ffmpeg process
+        """
+        list_chunks = self.get_chunks()
+        self.chunk_progress = {}
+        self.progress_lock = threading.Lock()
+        dir_chunks = tempfile.mkdtemp(prefix="chunks_", dir=os.path.dirname(self.ffmpeg_params.file_video))
+        try:
+            with ThreadPoolExecutor(max_workers=len(list_chunks)) as executor:
+                list_futures = [executor.submit(self.encode_chunk, dir_chunks, chunk_id, list_chunk_images,
+                    progress_callback=progress_callback, timeout=timeout)
+                    for chunk_id, list_chunk_images in enumerate(list_chunks)]
+                list_files_chunks = [future.result() for future in list_futures]
+            FFMPEGVideoConcatenator(list_files_chunks, self.ffmpeg_params.file_video).concat_videos()
+        finally:
+            shutil.rmtree(dir_chunks, ignore_errors=True)
         return
 
+dict_ffmpeg_scale_flags = {"nearest" : "neighbor", "linear" : "bilinear", "area" : "area", "cubic" : "bicubic", "lanczos" : "lanczos"}
+
+def get_ffmpeg_scale_filter(width, height, fit_mode="letterbox", interpolation="area", color_background="black"):
+    """
+    Returns the ffmpeg filter graph converting frames to width x height, fit modes and
+    interpolations are named as for utils_opencv.FrameNormalizer
+    """
+    if interpolation not in dict_ffmpeg_scale_flags:
+        raise ValueError(f"Unknown interpolation : {interpolation}, valid interpolations : {list(dict_ffmpeg_scale_flags.keys())}")
+    scale_flags = dict_ffmpeg_scale_flags[interpolation]
+    if fit_mode == "resize":
+        return f"scale={width}:{height}:flags={scale_flags}"
+    if fit_mode == "letterbox":
+        return (f"scale={width}:{height}:force_original_aspect_ratio=decrease:flags={scale_flags},"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color={color_background}")
+    if fit_mode == "crop":
+        return f"scale={width}:{height}:force_original_aspect_ratio=increase:flags={scale_flags},crop={width}:{height}"
+    raise ValueError(f"Unknown fit mode : {fit_mode}, valid fit modes : ['resize', 'letterbox', 'crop']")
+
 class FFMPEGImageToVideoWriter:
-    def __init__(self, file_video, fps=30, video_encoder="libx264", width=640, height=480, pixel_format_in="bgr24", pixel_format_out="yuv420p"):
+    def __init__(self, file_video, fps=30, video_encoder="libx264", width=640, height=480, pixel_format_in="bgr24", pixel_format_out="yuv420p", encoder_settings=None,
+        video_filter=None, extra_input_args=None, extra_output_args=None):
+        """
+        Parameters
+        ----------
+        file_video (str) : full path of video file
+        fps (int) : fps of video
+        video_encoder (str) : video encoder to be used, ignored if encoder_settings is given
+        width (int) : width of the image arrays written to the pipe
+        height (int) : height of the image arrays written to the pipe
+        pixel_format_in (str) : pixel format of the image arrays
+        pixel_format_out (str) : pixel format of the video, ignored if encoder_settings is given
+        encoder_settings (EncoderSettings) : encoder options, two pass encoding is not supported from the pipe
+        video_filter (str) : ffmpeg filter graph applied before encoding, e.g. from get_ffmpeg_scale_filter
+            to scale the images in the ffmpeg threads
+        extra_input_args (list) : additional ffmpeg inputs added after the pipe input, e.g. an audio source
+        extra_output_args (list) : additional ffmpeg output options, e.g. stream mapping and audio codec
+        """
+        if encoder_settings is None:
+            encoder_settings = EncoderSettings(video_encoder=video_encoder, pixel_format=pixel_format_out)
+        encoder_settings.validate()
+        if encoder_settings.two_pass:
+            raise ValueError("Two pass encoding needs a seekable input, not supported for streaming images")
         self.dtype = np.uint8
         self.ffmpeg_params = self.FFMPEGParams(fps=fps, width=width, height=height,
-            file_video=file_video, video_encoder=video_encoder,
-            pixel_format_in=pixel_format_in, pixel_format_out=pixel_format_out)
+            file_video=file_video, video_encoder=encoder_settings.video_encoder,
+            pixel_format_in=pixel_format_in, pixel_format_out=encoder_settings.pixel_format,
+            encoder_settings=encoder_settings, video_filter=video_filter)
+        self.extra_input_args = extra_input_args or []
+        self.extra_output_args = extra_output_args or []
         self.cmd_ffmpeg = self.get_ffmpeg_command()
-        self.popen_params = {"stdout": DEVNULL, "stdin": PIPE}
+        self.runner = None
         self.process = None
+        self.frame_buffer = None
 
     @dataclass
     class FFMPEGParams:
@@ -51,27 +319,598 @@ class FFMPEGImageToVideoWriter:
         video_encoder : str
         pixel_format_in : str
         pixel_format_out : str
+        encoder_settings : EncoderSettings
+        video_filter : str = None
 
-    def open_ffmpeg_process(self):
+    def open_ffmpeg_process(self, progress_callback=None, timeout=None):
         if self.process is None:
-            self.process = Popen(self.cmd_ffmpeg, **self.popen_params)
+            self.runner = FFMPEGProcessRunner(self.cmd_ffmpeg, progress_callback=progress_callback,
+                timeout=timeout, use_stdin=True).start()
+            self.process = self.runner.process
 
     def close_ffmpeg_process(self):
-        self.process.stdin.flush()
-        self.process.communicate(input="q".encode("GBK"))
+        """
+        Closes the pipe so that ffmpeg finishes the video, returns the FFMPEGRunResult and raises FFMPEGError on failure
+        """
+        return self.runner.wait()
 
     def get_ffmpeg_command(self):
-        cmd_ffmpeg = ["ffmpeg",
+        cmd_ffmpeg = ["ffmpeg", "-y",
             "-f", "rawvideo",
             "-vcodec", "rawvideo",
             "-s", f"{self.ffmpeg_params.width}x{self.ffmpeg_params.height}",
             "-pix_fmt", self.ffmpeg_params.pixel_format_in,
             "-r", f"{self.ffmpeg_params.fps}",
             "-an", "-i", "-",
-            "-c:v", self.ffmpeg_params.video_encoder,
-            "-pix_fmt", self.ffmpeg_params.pixel_format_out,
+            *self.extra_input_args,
+            *(["-vf", self.ffmpeg_params.video_filter] if self.ffmpeg_params.video_filter else []),
+            *self.ffmpeg_params.encoder_settings.get_ffmpeg_args(),
+            *self.extra_output_args,
             self.ffmpeg_params.file_video]
         return cmd_ffmpeg
 
+    def get_frame_buffer(self, num_channels=3):
+        """
+        Returns a reusable, preallocated C-contiguous frame buffer of the video dimensions,
+        frames filled in place in this buffer are written without any copy
+        """
+        frame_shape = (self.ffmpeg_params.height, self.ffmpeg_params.width, num_channels)
+        if self.frame_buffer is None or self.frame_buffer.shape != frame_shape:
+            self.frame_buffer = np.empty(frame_shape, dtype=self.dtype)
+        return self.frame_buffer
+
     def write_image_to_video(self, image_array):
-        self.process.stdin.write(image_array.astype(self.dtype).tobytes())
+        """
+        Writes the image to the ffmpeg pipe through a memoryview, the image is copied
+        (into the reusable frame buffer) only if it is not a C-contiguous uint8 array,
+        raises ValueError if the image is not of the video dimensions
+        """
+        frame_shape = (self.ffmpeg_params.height, self.ffmpeg_params.width, 3)
+        if image_array.shape != frame_shape:
+            raise ValueError(f"Image shape {image_array.shape} mismatch with the video frame shape {frame_shape}")
+        if image_array.dtype != self.dtype or not image_array.flags.c_contiguous:
+            frame_buffer = self.get_frame_buffer(image_array.shape[2] if image_array.ndim == 3 else 1)
+            np.copyto(frame_buffer, image_array.reshape(frame_buffer.shape), casting="unsafe")
+            image_array = frame_buffer
+        try:
+            self.runner.stdin.write(memoryview(image_array).cast("B"))
+        except BrokenPipeError:
+            self.runner.wait()
+            raise
+
+
+class FFMPEGStillImageSegmentWriter:
+    def __init__(self, file_video, fps=30, video_encoder="libx264", width=640, height=480, pixel_format_in="bgr24", pixel_format_out="yuv420p", extra_input_args=None, extra_output_args=None, encoder_settings=None):
+        """
+        Encodes a still image held for a number of frames as a standalone video segment,
+        the raw image is sent to ffmpeg only once and repeated by the loop filter
+
+        Parameters
+        ----------
+        file_video (str) : full path of the video segment file
+        fps (int) : fps of video
+        video_encoder (str) : video encoder to be used
+        width (int) : width of the video
+        height (int) : height of the video
+        pixel_format_in (str) : pixel format of the image array
+        pixel_format_out (str) : pixel format of the video
+        extra_input_args (list) : additional ffmpeg inputs added after the image input
+        extra_output_args (list) : additional ffmpeg output options
+        encoder_settings (EncoderSettings) : encoder options, video_encoder and pixel_format_out are ignored if given,
+            segments concatenated with other videos must use the same settings
+        """
+        if encoder_settings is None:
+            encoder_settings = EncoderSettings(video_encoder=video_encoder, pixel_format=pixel_format_out)
+        encoder_settings = replace(encoder_settings, two_pass=False)
+        self.dtype = np.uint8
+        self.ffmpeg_params = self.FFMPEGParams(fps=fps, width=width, height=height,
+            file_video=file_video, video_encoder=encoder_settings.video_encoder,
+            pixel_format_in=pixel_format_in, pixel_format_out=encoder_settings.pixel_format,
+            encoder_settings=encoder_settings)
+        self.extra_input_args = extra_input_args or []
+        self.extra_output_args = extra_output_args or []
+
+    @dataclass
+    class FFMPEGParams:
+        fps : int
+        width : int
+        height : int
+        file_video : str
+        video_encoder : str
+        pixel_format_in : str
+        pixel_format_out : str
+        encoder_settings : EncoderSettings
+
+    def get_ffmpeg_command(self, num_frames):
+        cmd_ffmpeg = ["ffmpeg", "-y",
+            "-f", "rawvideo",
+            "-vcodec", "rawvideo",
+            "-s", f"{self.ffmpeg_params.width}x{self.ffmpeg_params.height}",
+            "-pix_fmt", self.ffmpeg_params.pixel_format_in,
+            "-r", f"{self.ffmpeg_params.fps}",
+            "-an", "-i", "-",
+            *self.extra_input_args,
+            "-vf", f"loop=loop={num_frames-1}:size=1:start=0,setpts=N/({self.ffmpeg_params.fps}*TB)",
+            "-frames:v", f"{num_frames}",
+            "-r", f"{self.ffmpeg_params.fps}",
+            *self.ffmpeg_params.encoder_settings.get_ffmpeg_args(),
+            *self.extra_output_args,
+            self.ffmpeg_params.file_video]
+        return cmd_ffmpeg
+
+    def write_still_image(self, image_array, num_frames):
+        if num_frames < 1:
+            raise ValueError(f"Still image segment needs at least 1 frame, got {num_frames}")
+        image_array = np.ascontiguousarray(image_array, dtype=self.dtype)
+        runner = FFMPEGProcessRunner(self.get_ffmpeg_command(num_frames), use_stdin=True).start()
+        try:
+            runner.stdin.write(memoryview(image_array).cast("B"))
+        except BrokenPipeError:
+            pass
+        return runner.wait()
+
+class FFMPEGVideoConcatenator:
+    def __init__(self, list_files_video, file_video):
+        """
+        Concatenates video segments encoded with identical parameters using
+        the concat demuxer, the streams are copied without re-encoding
+
+        Parameters
+        ----------
+        list_files_video (list) : ordered list of full paths of the video segments
+        file_video (str) : full path of the concatenated video file
+        """
+        self.list_files_video = list_files_video
+        self.file_video = file_video
+
+    def check_segments(self):
+        """
+        Raises ValueError unless all segments have the same codec, size and pixel format,
+        the copied streams would otherwise fail to decode after the first segment
+        """
+        dict_segment_params = {}
+        for file_video in self.list_files_video:
+            if file_video not in dict_segment_params:
+                video_info = probe_video_info(file_video)
+                dict_segment_params[file_video] = (video_info.codec_name, video_info.width, video_info.height, video_info.pixel_format)
+        if len(set(dict_segment_params.values())) > 1:
+            raise ValueError("Video segments differ in codec, size or pixel format and cannot be concatenated without re-encoding : "
+                + "; ".join(f"{os.path.basename(file_video)} {codec_name} {width}x{height} {pixel_format}"
+                for file_video, (codec_name, width, height, pixel_format) in dict_segment_params.items()))
+        return
+
+    def concat_videos(self):
+        self.check_segments()
+        dir_tmp = tempfile.mkdtemp(prefix="concat_", dir=os.path.dirname(self.file_video))
+        try:
+            file_list = os.path.join(dir_tmp, "concat_list.txt")
+            with open(file_list, "w") as file_des:
+                file_des.write("ffconcat version 1.0\n")
+                for file_video in self.list_files_video:
+                    file_des.write(get_ffconcat_entry(os.path.abspath(file_video)))
+            cmd_ffmpeg = ["ffmpeg", "-y",
+                "-f", "concat", "-safe", "0", "-i", file_list,
+                "-map", "0:v", "-map", "0:a?", "-c", "copy",
+                self.file_video]
+            run_ffmpeg(cmd_ffmpeg)
+        finally:
+            shutil.rmtree(dir_tmp, ignore_errors=True)
+        return
+
+@dataclass
+class VideoInfo:
+    width : int
+    height : int
+    fps : str
+    codec_name : str
+    pixel_format : str
+    profile : str
+    level : int
+    time_base : str
+    num_frames : int
+    duration : float
+    audio_codec_name : str = None
+    audio_sample_rate : int = None
+    audio_channel_layout : str = None
+    audio_bit_rate : int = None
+
+    @property
+    def fps_value(self):
+        num, den = self.fps.split("/") if "/" in self.fps else (self.fps, 1)
+        return float(num) / float(den)
+
+    @property
+    def has_audio(self):
+        return self.audio_codec_name is not None
+
+def probe_video_info(file_video):
+    """
+    Returns VideoInfo of the first video (and audio) stream of the video file using ffprobe
+    """
+    cmd_ffprobe = ["ffprobe", "-v", "error",
+        "-show_streams", "-show_format",
+        "-of", "json", file_video]
+    result = run(cmd_ffprobe, stdout=PIPE, stderr=PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {file_video} : {result.stderr.decode(errors='replace')[-2000:]}")
+    probe = json.loads(result.stdout)
+    streams = probe.get("streams", [])
+    video_streams = [stream for stream in streams if stream.get("codec_type") == "video"]
+    audio_streams = [stream for stream in streams if stream.get("codec_type") == "audio"]
+    if len(video_streams) == 0:
+        raise RuntimeError(f"No video stream found in {file_video}")
+
+    video_stream = video_streams[0]
+    video_info = VideoInfo(width=int(video_stream["width"]), height=int(video_stream["height"]),
+        fps=video_stream.get("avg_frame_rate") if video_stream.get("avg_frame_rate", "0/0") != "0/0" else video_stream.get("r_frame_rate"),
+        codec_name=video_stream.get("codec_name"), pixel_format=video_stream.get("pix_fmt"),
+        profile=video_stream.get("profile"), level=int(video_stream.get("level", -99)),
+        time_base=video_stream.get("time_base"), num_frames=int(video_stream.get("nb_frames", 0)),
+        duration=float(video_stream.get("duration", probe.get("format", {}).get("duration", 0))))
+    if len(audio_streams) > 0:
+        audio_stream = audio_streams[0]
+        video_info.audio_codec_name = audio_stream.get("codec_name")
+        video_info.audio_sample_rate = int(audio_stream.get("sample_rate", 48000))
+        video_info.audio_channel_layout = audio_stream.get("channel_layout", "stereo")
+        video_info.audio_bit_rate = int(audio_stream["bit_rate"]) if "bit_rate" in audio_stream else None
+    return video_info
+
+def probe_num_frames(file_video):
+    """
+    Returns the exact number of frames of the first video stream, counted by ffprobe from the
+    demuxed packets without decoding, the container frame count is often missing or wrong
+    """
+    cmd_ffprobe = ["ffprobe", "-v", "error",
+        "-select_streams", "v:0", "-count_packets",
+        "-show_entries", "stream=nb_read_packets",
+        "-of", "json", file_video]
+    result = run(cmd_ffprobe, stdout=PIPE, stderr=PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {file_video} : {result.stderr.decode(errors='replace')[-2000:]}")
+    streams = json.loads(result.stdout).get("streams", [])
+    if len(streams) == 0:
+        raise RuntimeError(f"No video stream found in {file_video}")
+    return int(streams[0].get("nb_read_packets", 0))
+
+def probe_keyframe_ids(file_video, fps=None):
+    """
+    Returns the sorted frame ids of the keyframes of the first video stream, read by ffprobe from the
+    packet flags without decoding, the ids are derived from the presentation timestamps at fps
+    """
+    fps = fps or probe_video_info(file_video).fps_value
+    cmd_ffprobe = ["ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=print_section=0", file_video]
+    result = run(cmd_ffprobe, stdout=PIPE, stderr=PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {file_video} : {result.stderr.decode(errors='replace')[-2000:]}")
+    list_packets = []
+    for line in result.stdout.decode(errors="replace").splitlines():
+        pts_time, _, flags = line.strip().partition(",")
+        if pts_time not in ("", "N/A"):
+            list_packets.append((float(pts_time), "K" in flags))
+    if len(list_packets) == 0:
+        return []
+    pts_time_start = min(pts_time for pts_time, _ in list_packets)
+    return sorted(int(round((pts_time - pts_time_start) * fps)) for pts_time, is_key in list_packets if is_key)
+
+class FFMPEGVideoReader:
+    dict_pixel_format_channels = {"bgr24" : 3, "rgb24" : 3, "gray" : 1}
+
+    def __init__(self, file_video, num_threads=0, pixel_format="bgr24", num_buffers=4, max_forward_skip=64):
+        """
+        Video reader with the VideoReader interface, decoding with ffmpeg to raw frames on its stdout,
+        the frames are read with readinto into a ring of preallocated buffers, a returned frame is
+        overwritten num_buffers reads later, so consumers queueing frames need num_buffers above their queue size
+
+        Parameters
+        ----------
+        file_video (str) : full path of valid video file
+        num_threads (int) : decoder threads, 0 lets ffmpeg decide
+        pixel_format (str) : pixel format of the frames, one of dict_pixel_format_channels
+        num_buffers (int) : number of frame buffers in the ring
+        max_forward_skip (int) : max number of frames skipped by decoding forward instead of restarting ffmpeg at the seek time
+        """
+        if pixel_format not in self.dict_pixel_format_channels:
+            raise ValueError(f"Unknown pixel format : {pixel_format}, valid pixel formats : {list(self.dict_pixel_format_channels.keys())}")
+        self.file_video = file_video
+        self.num_threads = num_threads
+        self.pixel_format = pixel_format
+        self.num_buffers = max(2, num_buffers)
+        self.max_forward_skip = max_forward_skip
+        self.video_info = None
+        self.num_images = None
+        self.runner = None
+        self.frame_buffers = None
+        self.buffer_id = 0
+        self.position = 0
+        self.stride = 1
+        self.is_at_end = False
+
+    def init_video_reader(self):
+        """
+        Probes the video, ffmpeg is started lazily by the first read at the start frame and stride set by seek or iter_images
+        """
+        if self.video_info is None:
+            if not os.path.isfile(self.file_video):
+                raise IOError(f"Failed to open the video : {self.file_video}")
+            self.video_info = probe_video_info(self.file_video)
+            self.num_images = probe_num_frames(self.file_video)
+            num_channels = self.dict_pixel_format_channels[self.pixel_format]
+            frame_shape = (self.video_info.height, self.video_info.width, num_channels)
+            self.frame_buffers = [np.empty(frame_shape, dtype=np.uint8) for _ in range(self.num_buffers)]
+            self.set_read_position(0)
+        return
+
+    def get_ffmpeg_command(self, start_frame=0, stride=1):
+        """
+        Input seeking decodes from the preceding keyframe and drops the frames before the seek time,
+        which is set half a frame early so that frame start_frame is the first frame output.
+        Every stride-th frame is selected by ffmpeg, a stride of None outputs only the keyframes, -skip_frame nokey
+        only speeds up decoding since it also outputs I-frames of non key packets, which the key flag select drops,
+        so the frames match the key packets listed by probe_keyframe_ids
+        """
+        seek_args = []
+        if start_frame > 0:
+            seek_args = ["-ss", f"{max(0.0, (start_frame - 0.5) / self.video_info.fps_value):.6f}"]
+        cmd_ffmpeg = ["ffmpeg",
+            "-threads", f"{self.num_threads}",
+            *(["-skip_frame", "nokey"] if stride is None else []),
+            *seek_args,
+            "-i", self.file_video,
+            "-map", "0:v:0",
+            *(["-vf", "select=eq(key\\,1)"] if stride is None else []),
+            *(["-vf", f"select=not(mod(n\\,{stride}))"] if stride is not None and stride > 1 else []),
+            "-f", "rawvideo",
+            "-pix_fmt", self.pixel_format,
+            "-fps_mode", "passthrough",
+            "-"]
+        return cmd_ffmpeg
+
+    def open_ffmpeg_process(self, start_frame=0, stride=1):
+        self.close_ffmpeg_process()
+        self.runner = FFMPEGProcessRunner(self.get_ffmpeg_command(start_frame, stride=stride), use_stdout=True,
+            use_process_cap=False).start()
+        self.position = start_frame
+        self.stride = stride
+        self.is_at_end = False
+        return
+
+    def set_read_position(self, start_frame, stride=1):
+        """
+        Stops ffmpeg, the next read starts it at start_frame with stride
+        """
+        self.close_ffmpeg_process()
+        self.position = start_frame
+        self.stride = stride
+        self.is_at_end = False
+        return
+
+    def close_ffmpeg_process(self):
+        if self.runner is not None:
+            # closing the pipe first unblocks ffmpeg writing a frame, so it exits on terminate instead of after the grace period
+            self.runner.stdout.close()
+            self.runner.cancel()
+            self.runner.wait(check=False)
+            self.runner = None
+        return
+
+    def close_video_reader(self):
+        self.close_ffmpeg_process()
+        self.video_info = None
+        self.frame_buffers = None
+        return
+
+    def get_num_images_in_video(self):
+        return self.num_images
+
+    def get_fps(self):
+        return self.video_info.fps_value
+
+    def read_frame_into(self, frame_buffer):
+        """
+        Fills frame_buffer from the ffmpeg stdout, returns False at the end of the video,
+        raises FFMPEGError if ffmpeg failed
+        """
+        frame_view = memoryview(frame_buffer).cast("B")
+        num_read = 0
+        while num_read < len(frame_view):
+            num_bytes = self.runner.stdout.readinto(frame_view[num_read:])
+            if not num_bytes:
+                break
+            num_read += num_bytes
+        if num_read == len(frame_view):
+            return True
+        self.runner.wait(check=True)
+        return False
+
+    def get_next_image(self):
+        if self.runner is None:
+            if self.is_at_end or self.frame_buffers is None:
+                return False, None
+            self.open_ffmpeg_process(self.position, stride=self.stride)
+        frame_buffer = self.frame_buffers[self.buffer_id]
+        if not self.read_frame_into(frame_buffer):
+            self.runner = None
+            self.is_at_end = True
+            return False, None
+        self.buffer_id = (self.buffer_id + 1) % self.num_buffers
+        self.position += self.stride or 1
+        return True, frame_buffer
+
+    def skip_next_image(self):
+        ret_val, _ = self.get_next_image()
+        return ret_val
+
+    def seek(self, n):
+        """
+        Moves the reader to frame n, frames a short distance ahead of the current position
+        are read and dropped, otherwise ffmpeg is restarted at the time of frame n
+        """
+        is_sequential = self.stride == 1 and not self.is_at_end
+        if n == self.position and is_sequential:
+            return True
+        if is_sequential and self.runner is not None and self.position < n <= self.position + self.max_forward_skip:
+            while self.position < n:
+                if not self.skip_next_image():
+                    return False
+            return True
+        if not (0 <= n < self.num_images):
+            return False
+        self.set_read_position(n)
+        return True
+
+    def seek_time(self, time_sec):
+        return self.seek(int(round(time_sec * self.video_info.fps_value)))
+
+    def get_nth_image(self, n):
+        if not self.seek(n):
+            return False, None
+        return self.get_next_image()
+
+    def iter_images(self, start=0, end=None, stride=1):
+        """
+        Yields (n, img) for every stride-th frame in [start, end) decoded in order, img is a ring buffer
+        overwritten num_buffers reads later, the skipped frames are dropped by ffmpeg and not piped
+
+        Parameters
+        ----------
+        start (int) : id of the first frame
+        end (int) : id after the last frame, None to read until the end of the video
+        stride (int) : step between the yielded frames
+        """
+        if stride > 1:
+            if not (0 <= start < self.num_images):
+                return
+            self.set_read_position(start, stride=stride)
+        elif not self.seek(start):
+            return
+        while end is None or self.position < end:
+            n = self.position
+            ret_val, img = self.get_next_image()
+            if not ret_val:
+                break
+            yield n, img
+        return
+
+    def iter_keyframes(self, list_keyframe_ids):
+        """
+        Yields (n, img) for the keyframes in list_keyframe_ids, ffmpeg skips decoding all other frames,
+        list_keyframe_ids must be the consecutive keyframe ids from probe_keyframe_ids
+        """
+        if len(list_keyframe_ids) == 0:
+            return
+        self.set_read_position(list_keyframe_ids[0], stride=None)
+        for n in list_keyframe_ids:
+            ret_val, img = self.get_next_image()
+            if not ret_val:
+                break
+            yield n, img
+        self.close_ffmpeg_process()
+        return
+
+class FFMPEGPrologueEpilogueWriter:
+    dict_video_encoders = {"h264": "libx264", "hevc": "libx265", "mpeg4": "mpeg4",
+        "vp9": "libvpx-vp9", "av1": "libaom-av1"}
+    dict_audio_encoders = {"aac": "aac", "mp3": "libmp3lame", "opus": "libopus",
+        "vorbis": "libvorbis", "ac3": "ac3"}
+    dict_video_profiles = {"Constrained Baseline": "baseline", "Baseline": "baseline",
+        "Main": "main", "High": "high", "High 10": "high10", "High 4:2:2": "high422",
+        "High 4:4:4 Predictive": "high444", "Main 10": "main10", "Main Still Picture": "mainstillpicture"}
+
+    def __init__(self, file_video_in, file_video_out):
+        """
+        Adds prologue and epilogue to an existing video, only the title and blank segments
+        are encoded with parameters matching the source video, the source video streams are
+        copied and concatenated with the segments without re-encoding
+
+        Parameters
+        ----------
+        file_video_in (str) : full path of the source video file
+        file_video_out (str) : full path of the video file to be created
+        """
+        self.file_video_in = file_video_in
+        self.file_video_out = file_video_out
+        self.video_info = probe_video_info(file_video_in)
+        if self.video_info.codec_name not in self.dict_video_encoders:
+            raise RuntimeError(f"Unsupported video codec for stream copy concat : {self.video_info.codec_name}")
+
+    def get_segment_output_args(self):
+        video_info = self.video_info
+        output_args = []
+        profile = self.dict_video_profiles.get(video_info.profile)
+        if video_info.codec_name in ("h264", "hevc") and profile is not None:
+            output_args += ["-profile:v", profile]
+        if video_info.codec_name == "h264" and video_info.level > 0:
+            output_args += ["-level", f"{video_info.level / 10:.1f}"]
+        if video_info.codec_name == "hevc":
+            output_args += ["-tag:v", "hvc1"]
+        if video_info.has_audio:
+            output_args += ["-map", "0:v", "-map", "1:a",
+                "-c:a", self.dict_audio_encoders.get(video_info.audio_codec_name, video_info.audio_codec_name),
+                "-ar", f"{video_info.audio_sample_rate}", "-shortest"]
+            if video_info.audio_bit_rate is not None:
+                output_args += ["-b:a", f"{video_info.audio_bit_rate}"]
+        if os.path.splitext(self.file_video_out)[1].lower() in (".mp4", ".mov", ".m4v"):
+            output_args += ["-video_track_timescale", video_info.time_base.split("/")[1]]
+        return output_args
+
+    def get_segment_input_args(self):
+        if not self.video_info.has_audio:
+            return []
+        return ["-f", "lavfi", "-i",
+            f"anullsrc=r={self.video_info.audio_sample_rate}:cl={self.video_info.audio_channel_layout}"]
+
+    def write_segment(self, file_segment, image_array, num_frames):
+        FFMPEGStillImageSegmentWriter(file_video=file_segment, fps=self.video_info.fps,
+            video_encoder=self.dict_video_encoders[self.video_info.codec_name],
+            width=self.video_info.width, height=self.video_info.height,
+            pixel_format_out=self.video_info.pixel_format,
+            extra_input_args=self.get_segment_input_args(),
+            extra_output_args=self.get_segment_output_args()).write_still_image(image_array, num_frames)
+        return
+
+    def add_prologue_epilogue(self, prologue_img=None, num_prologue_sec=0, epilogue_img=None, num_epilogue_sec=0, num_blank_sec=1):
+        """
+        Parameters
+        ----------
+        prologue_img (np.ndarray) : bgr prologue image of the source video dimensions
+        num_prologue_sec (float) : duration of the prologue
+        epilogue_img (np.ndarray) : bgr epilogue image of the source video dimensions
+        num_epilogue_sec (float) : duration of the epilogue
+        num_blank_sec (float) : duration of the blank segment between the titles and the source video
+        """
+        fps = self.video_info.fps_value
+        file_ext = os.path.splitext(self.file_video_out)[1]
+        dir_segments = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(self.file_video_out))
+        try:
+            list_files_segments = []
+            file_blank = os.path.join(dir_segments, "blank" + file_ext)
+            num_blank_frames = int(round(num_blank_sec * fps))
+            if num_blank_frames > 0:
+                self.write_segment(file_blank, np.zeros((self.video_info.height, self.video_info.width, 3),
+                    dtype=np.uint8), num_blank_frames)
+
+            if num_prologue_sec > 0:
+                file_prologue = os.path.join(dir_segments, "prologue" + file_ext)
+                self.write_segment(file_prologue, prologue_img, int(round(num_prologue_sec * fps)))
+                list_files_segments.append(file_prologue)
+                if num_blank_frames > 0:
+                    list_files_segments.append(file_blank)
+
+            list_files_segments.append(self.file_video_in)
+
+            if num_epilogue_sec > 0:
+                file_epilogue = os.path.join(dir_segments, "epilogue" + file_ext)
+                self.write_segment(file_epilogue, epilogue_img, int(round(num_epilogue_sec * fps)))
+                if num_blank_frames > 0:
+                    list_files_segments.append(file_blank)
+                list_files_segments.append(file_epilogue)
+
+            # the concat demuxer auto inserts the h264_mp4toannexb filter, so parameter sets
+            # of the source and the generated segments are both carried in band
+            FFMPEGVideoConcatenator(list_files_segments, self.file_video_out).concat_videos()
+        finally:
+            shutil.rmtree(dir_segments, ignore_errors=True)
+        return
@@ -0,0 +1,77 @@
+import os
+import sys
+import shutil
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from video_utils_ffmpeg import FFMPEGSavedImageToVideoWriter, FFMPEGChunkedImageToVideoWriter
+
+num_bits = 8
+width, height = 32 * num_bits, 64
+
+def get_frame_image(frame_id):
+    """
+    Returns an image encoding frame_id as black and white bars, robust to lossy encoding
+    """
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    for bit in range(num_bits):
+        if (frame_id >> bit) & 1:
+            img[:, bit * 32:(bit + 1) * 32] = 255
+    return img
+
+def get_frame_id(img):
+    return sum(1 << bit for bit in range(num_bits) if img[:, bit * 32 + 8:(bit + 1) * 32 - 8].mean() > 127)
+
+def write_images(dir_images, num_images):
+    os.makedirs(dir_images, exist_ok=True)
+    list_images = [f"image-{10000 + i}.png" for i in range(num_images)]
+    for i, file_image in enumerate(list_images):
+        cv2.imwrite(os.path.join(dir_images, file_image), get_frame_image(i))
+    return list_images
+
+def decode_frame_ids(file_video):
+    video_capture = cv2.VideoCapture(file_video)
+    list_frame_ids = []
+    while True:
+        ret_val, img = video_capture.read()
+        if not ret_val:
+            break
+        list_frame_ids.append(get_frame_id(img))
+    video_capture.release()
+    return list_frame_ids
+
+@pytest.mark.parametrize("fps", [25, 30, 60])
+def test_saved_images_keep_every_frame_once_in_order(tmp_path, fps):
+    dir_images = str(tmp_path / "images")
+    list_images = write_images(dir_images, 60)
+    file_video = str(tmp_path / "video.mp4")
+    FFMPEGSavedImageToVideoWriter(dir_images, file_video, fps=fps, crf=18,
+        list_images=list_images).generate_video_from_saved_images()
+    assert decode_frame_ids(file_video) == list(range(60))
+
+def test_saved_images_hold_counts_repeat_images(tmp_path):
+    dir_images = str(tmp_path / "images")
+    list_images = write_images(dir_images, 10)
+    hold_counts = [1, 3, 1, 2, 1, 1, 4, 1, 1, 2]
+    file_video = str(tmp_path / "video.mp4")
+    FFMPEGSavedImageToVideoWriter(dir_images, file_video, fps=30, crf=18,
+        list_images=list_images, hold_counts=hold_counts).generate_video_from_saved_images()
+    assert decode_frame_ids(file_video) == [i for i, hold_count in enumerate(hold_counts) for _ in range(hold_count)]
+
+def test_chunked_and_single_pass_decode_to_the_same_frames(tmp_path):
+    dir_images = str(tmp_path / "images")
+    list_images = write_images(dir_images, 120)
+    file_video_single = str(tmp_path / "single.mp4")
+    file_video_chunked = str(tmp_path / "chunked.mp4")
+    FFMPEGSavedImageToVideoWriter(dir_images, file_video_single, fps=30, crf=18,
+        list_images=list_images).generate_video_from_saved_images()
+    FFMPEGChunkedImageToVideoWriter(dir_images, list_images, file_video_chunked, fps=30, crf=18,
+        num_chunks=3, gop_size=20).generate_video_from_saved_images()
+    list_frame_ids = decode_frame_ids(file_video_chunked)
+    assert list_frame_ids == list(range(120))
+    assert list_frame_ids == decode_frame_ids(file_video_single)